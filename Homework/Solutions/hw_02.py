@@ -4,7 +4,6 @@
 Let's quickly crank out some values for Homework 2.
 '''
 import sys
-import datetime as dt
 
 import numpy as np
 
@@ -13,40 +12,22 @@ path = '../../Python/'
 if path not in sys.path: sys.path.append(path)
 
 # Now import sciprog:
-from sciprog import ImfData
+from sciprog import ImfData, DstData
 
 def read_dst(filename):
     '''
-    Adapted from Spacepy's `spacepy.pybats.Kyoto` module, this 
-    reads KyotoWDC's rather sticky file format.
-    '''
+    Read KyotoWDC's rather sticky file format.  Returns arrays of times
+    (*datetime64*) and Dst values.  The work is done by sciprog.DstData,
+    which also accepts a list of files.
 
-    with open(filename, 'r') as f:
-        lines = f.readlines()
-        
-    npts=len(lines)
-    time = []
-    dst  = np.zeros(24*npts)
-    for i,line in enumerate(lines):
-        # Get year, month, day.
-        try:
-            yy = int(line[14:16]) * 100
-        except:
-            yy = 1900
-        yy = yy + int(line[3:5])
-        dd = int(line[8:10])
-        mm = int(line[5:7 ])
-        
-        # Parse the rest of the data.
-        for j in range(0,24):
-            time.append(dt.datetime(yy, mm, dd, j))
-            loc = 20 + 4*j
-            dst[24*i + j] = float(line[loc:loc+4])
+    Note that this differs from the original version of this function:
+    times are *datetime64* values rather than datetime objects, missing
+    values are NaN rather than 9999, and each day's base value is added.
+    '''
 
-    time  = np.array(time)
-    dst   = np.array(dst)
+    dst = DstData(filename)
 
-    return time, dst
+    return dst['time'], dst['dst']
 
 if __name__ == "__main__":
     # IMF WORK:
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+'''
+Benchmark the ImfData.calc_* methods.  A large, random solar wind data set
+is made in memory, then |B|, |V|, clock angle, and epsilon are calculated
+two ways: the "before" way, with plain Numpy expressions that make a new
+array for every step, and the "after" way, using the blocked, in-place
+calc_* methods of sciprog.ImfData.  Run time and peak memory used (beyond
+the input data) are printed for each.
+'''
+
+from argparse import ArgumentParser
+
+parser = ArgumentParser(description=__doc__)
+parser.add_argument('-n', '--npts', help='Number of data points to use. ' +
+                    'Defaults to 10 million.', type=float, default=1E7)
+parser.add_argument('-r', '--repeat', help='Number of times to repeat each ' +
+                    'test; the best time is kept.  Defaults to 3.',
+                    type=int, default=3)
+args = parser.parse_args()
+
+import time
+import tracemalloc
+import numpy as np
+from sciprog import ImfData, imf_vars
+
+
+def calc_before(imf):
+    '''
+    Calculate derived values the way sciprog used to: one full-sized
+    temporary array for every operation.
+    '''
+    imf['b'] = np.sqrt(imf['bx']**2 + imf['by']**2 + imf['bz']**2)
+    imf['v'] = np.sqrt(imf['vx']**2 + imf['vy']**2 + imf['vz']**2)
+    imf['clock'] = np.arctan2(imf['by'], imf['bz'])
+    conv = 1000. * 1E-9**2 / (4*np.pi*1E-7)
+    imf['epsilon'] = conv*imf['v'] * imf['b']**2 \
+        * np.sin(imf['clock']/2)**4
+
+
+def calc_after(imf, out):
+    '''
+    Calculate derived values with the blocked calc_* methods, writing into
+    the preallocated arrays in dictionary *out*.
+    '''
+    for name in ['b', 'v', 'clock', 'epsilon']:
+        getattr(imf, 'calc_' + name)(out=out[name])
+
+
+def measure(func, *funcargs):
+    '''
+    Run *func* with *funcargs* several times.  Return the best run time in
+    seconds and the peak memory allocated during a run in megabytes.
+    '''
+    best, peak = np.inf, 0
+    for i in range(args.repeat):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        func(*funcargs)
+        best = min(best, time.perf_counter() - t0)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return best, peak / 1024**2
+
+
+npts = int(args.npts)
+
+# Build random solar wind values:
+rng = np.random.default_rng(42)
+values = rng.normal(0, 5, (len(imf_vars), npts))
+values[3] -= 400.
+time_array = np.datetime64('2000-01-01', 'ms') + np.arange(npts)*60000
+imf = ImfData.from_arrays(time_array, values)
+
+# Output arrays for the "after" test are made ahead of time, as a caller
+# that re-uses its buffers would do:
+out = {name: np.empty(npts) for name in ['b', 'v', 'clock', 'epsilon']}
+
+t_before, m_before = measure(calc_before, imf)
+t_after, m_after = measure(calc_after, imf, out)
+
+print(f'Derived values for {npts:,d} points:')
+print(f'{"":8s}{"Time (s)":>12s}{"Peak memory (MB)":>20s}')
+print(f'{"Before":8s}{t_before:12.3f}{m_before:20.1f}')
+print(f'{"After":8s}{t_after:12.3f}{m_after:20.1f}')
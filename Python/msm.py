@@ -5,120 +5,606 @@ time using solar input from a SWMF-formatted ascii solar wind file.
 See Freeman and Morley 2004, GRL.
 '''
 
-# The argparse module handles input arguments from the unix shell
-# command line interface.  We'll cover this more during our
-# scripting section.
-from argparse import ArgumentParser
-
-# Handle all arguments first before performing the rest
-# of the script.  Start by creating the parser object and using the
-# docstring as our help message. 
-parser = ArgumentParser(description=__doc__)
-
-# Now, for each argument/option, add it to the parser and add help info.
-# Documentation of argparse is found here: https://docs.python.org/3/library/argparse.html
-# ...and a good tutorial is found here: https://docs.python.org/3/howto/argparse.html
-# Note how we use argparse to set defaults!
-parser.add_argument('imffile', help='The name of the IMF input file to read.',
-                    type=str)
-parser.add_argument('-D', '--D', help='Value of the substorm time constant. '+
-                    'Defaults to 2.69 hours.', type=float, default=2.69)
-
-# Get args from caller, collect arguments into a convenient object:
-args = parser.parse_args()
-
-# Now begin the rest of our script.
 # Start with our imports, starting with the standard Python library, then
 # user-installed libraries, then user-generated libraries.
 import os
 import numpy as np
-import matplotlib.pyplot as plt
 from sciprog import ImfData, smartTimeTicks
 
-# Set our plotting style:
-plt.style.use('seaborn-darkgrid')
-        
-# Set D constant in seconds.   Note how we obtain
-# the value from "args", set by argparse.
-D = args.D * 3600. # Hours -> seconds
-        
-# Open data file, calculate required values.  Use
-# our object oriented approach.
-imf = ImfData(args.imffile)
-imf.calc_epsilon()  # This also calculates |V| and |B|.
-
-# Create results containers: energy will have the
-# same number of entries as our solar wind file.
-# We don't know how many substorms we'll generate a priori,
-# so we'll create an empty list to which we can append values.
-n_pts = imf['time'].size
-energy = np.zeros(n_pts)
-epochs = []
-
-# Set our initial energy condition.  Do this by assuming a substorm
-# just happened, so our energy state is D*P below the energy
-# threshold value (assumed to be zero, see the powerpoint file).
-# Use the average epsilon value to initialize:
-energy[0] = -D*imf['epsilon'].mean()
-
-# Integrate!
-# Loop over all subsequent time values.  "i" represents the
-# position of t_now + delta T; i-1 is t_now.  Each iteration
-# advances from t_now to t_now + delta T.
-for i in range(1, n_pts):
-    # Get time step from imf file.  Subtract two times, which
-    # gives us a "timedelta" object.  By calling the "total_seconds"
-    # method, we convert it into a floating point value.
-    dt = (imf['time'][i]-imf['time'][i-1]).total_seconds()
-
-    # This is our actual integration step (Euler's Method):
-    energy[i] = energy[i-1]+imf['epsilon'][i]*dt
-
-    # See if we crossed our threshold:
-    if energy[i] >= 0:
-        # If so, "release energy" as required by MSM:
-        energy[i] = - D*imf['epsilon'][i]
-        # Save epoch to list:
-        epochs.append(imf['time'][i])
-
-# Save epochs to file.  Note that we're using the "with" statement.
-# See sciprog.py for details on this.
-# Note how we end each line with a newline character (\n).
-with open('substorm_epochs.txt', 'w') as f:
-    f.write('Substorm onsets created from the Minimal Substorm Model (MSM)\n')
-    f.write(f'Input file used: {args.imffile}\n')
-    for e in epochs: f.write(f'{e:%Y-%m-%d %H:%M:%S} UT \n')
-        
-# Create figure object and axes objects.
-fig = plt.figure()
-a1, a2 = fig.add_subplot(211), fig.add_subplot(212)
-
-# Create line plots:
-a1.plot(imf['time'], imf['epsilon'], 'r-', lw=2)
-a2.plot(imf['time'], energy,          '-', lw=2)
-
-# Create and label horizontal threshold line:
-a2.text(imf['time'][0], 0.05, 'Substorm Energy Threshold')
-a2.hlines(0.0, imf['time'][0], imf['time'][-1], linestyles='dashed', lw=2.0)
-
-# Place epochs onto plot, preserving y-limits.
-ymin, ymax = a2.get_ylim()                    # get current axis limits.
-ymax = .2                                     # add some space above zero.
-a2.vlines(epochs, ymin, ymax, colors='k')     # add our vlines.  This changes limits...
-a2.set_ylim( [ymin, ymax] )                   # restore ylimits to good values.
-
-# Y-axes labels:
-a1.set_ylabel('Solar Wind Power' , size=14)
-a2.set_ylabel('Tail Energy State', size=14)
-
-# Y-axis ticks:
-a1.set_yticklabels('')
-a2.set_yticklabels('')
-
-# Set time ticks:
-smartTimeTicks(a1, imf['time'])
-smartTimeTicks(a2, imf['time'], True)
-
-fig.tight_layout()
-
-plt.show()
+# Matplotlib is only imported when plotting (see plot_msm), so importing
+# this module or running it with --no-plot never loads it.
+
+
+def run_msm(imf, D=2.69):
+    '''
+    Run the Minimal Substorm Model using solar wind data *imf*, either an
+    ImfData object or the name of an IMF file, and a substorm time constant
+    of *D* hours.  Returns two arrays: the tail energy state at each time
+    and the times of substorm onsets.
+
+    Between onsets, the tail energy is a running (cumulative) sum of
+    epsilon*dt.  Rather than stepping through every point with a Python
+    loop, we find each stretch between onsets and fill it with a single
+    call to np.cumsum.  Because np.cumsum adds values one at a time, in
+    order, the results are exactly the same as the loop.
+
+    Points with bad (NaN) epsilon are skipped, just as in MSMState: the
+    step over a bad point is taken in one go, and the energy there is NaN.
+    '''
+
+    if not isinstance(imf, ImfData):
+        imf = ImfData(imf)
+
+    good, inputs = _msm_inputs(imf)
+    energy, onsets = _integrate(*inputs, D)
+
+    # Put the energy back on the full set of times:
+    if not good.all():
+        full = np.full(good.size, np.nan)
+        full[good] = energy
+        energy = full
+
+    return energy, imf['time'][good][onsets]
+
+
+def _msm_inputs(imf):
+    '''
+    Get the arrays needed to run the MSM from ImfData object *imf*.
+    Returns a boolean array marking the points with good (not NaN)
+    epsilon, and a tuple of arrays for *_integrate* built from the good
+    points only: epsilon, the energy gained between each pair of points,
+    and the running total of that energy.  These don't depend on D, so
+    they can be reused.
+    '''
+
+    time, eps = imf['time'], imf['epsilon']  # Also calculates |V| and |B|.
+
+    # Bad points are dropped, so one step spans each run of them:
+    good = ~np.isnan(eps)
+    if not good.all():
+        time, eps = time[good], eps[good]
+
+    # Get all of our time steps at once.  Our time values are "datetime64"
+    # values, so subtracting them gives "timedelta64" values.  Dividing by
+    # a one-second timedelta turns them into floating point seconds.
+    # gain[i-1] is the energy added going from point i-1 to point i.
+    gain = eps[1:] * (np.diff(time) / np.timedelta64(1, 's'))
+
+    # The total energy gained since the start gives a quick guess of where
+    # each onset will be: the first point where the energy gained since
+    # the last onset makes up for the energy released.
+    total = np.cumsum(gain)
+
+    return good, (eps, gain, total)
+
+
+def _integrate(eps, gain, total, D, start_energy=None):
+    '''
+    Integrate the MSM given the arrays from *_msm_inputs* and time constant
+    *D* in hours.  Returns the tail energy and the indexes of onsets.  The
+    energy at the first point can be given with kwarg *start_energy*.
+    '''
+
+    # Set D constant in seconds.
+    D = D * 3600.  # Hours -> seconds
+
+    n_pts = eps.size
+    energy = np.zeros(n_pts)
+    onsets = []
+    if n_pts == 0:
+        return energy, onsets
+
+    # Set our initial energy condition.  Do this by assuming a substorm
+    # just happened, so our energy state is D*P below the energy
+    # threshold value (assumed to be zero, see the powerpoint file).
+    # Use the average epsilon value (of good values only) to initialize:
+    energy[0] = -D*np.nanmean(eps) if start_energy is None else start_energy
+
+    start = 0
+    while start < n_pts - 1:
+        # Guess the end of this stretch, then add a bit extra:
+        before = total[start-1] if start else 0.
+        guess = np.searchsorted(total, before - energy[start], side='right')
+        stop = min(max(guess + 16, start + 16), n_pts - 1)
+
+        # Integrate from our start, checking for a threshold crossing.  If
+        # the guess was too short (round off), keep going from where we
+        # stopped, doubling the size of the next stretch.
+        here = start
+        while True:
+            stretch = np.cumsum(np.concatenate([energy[here:here+1],
+                                                gain[here:stop]]))
+            crossed = np.flatnonzero(stretch[1:] >= 0)
+            if crossed.size:
+                stop = here + crossed[0] + 1
+                energy[here+1:stop] = stretch[1:crossed[0]+1]
+                break
+            energy[here+1:stop+1] = stretch[1:]
+            if stop == n_pts - 1:
+                break
+            here, stop = stop, min(stop + 2*(stop-start), n_pts - 1)
+
+        if not crossed.size:
+            # Reached the end of the data without another onset.
+            break
+
+        # If so, "release energy" as required by MSM, and save the epoch:
+        energy[stop] = -D*eps[stop]
+        onsets.append(stop)
+        start = stop
+
+    return energy, onsets
+
+
+class MSMState(object):
+    '''
+    The Minimal Substorm Model, run one step at a time as solar wind data
+    arrives.  Create it with the substorm time constant, *D*, in hours.
+    Feed it new data with *update* (one time and epsilon value; fast) or
+    *feed* (a whole ImfData object or chunk; see sciprog.iter_imf_chunks.)
+    Both return any new substorm onsets.
+
+    The state (tail energy, time of the last point, and the running sum
+    and count of epsilon values) can be saved with *save* and restored with
+    MSMState.load, so a restarted process picks up where it left off.
+
+    Before the first data arrives, the tail energy is unknown.  Either
+    give it with kwarg *energy* or it is set as in *run_msm*, from the
+    mean epsilon of the first chunk given to *feed* (or the first value
+    given to *update*.)  Records with bad (NaN) epsilon are skipped.
+    '''
+
+    def __init__(self, D=2.69, energy=None):
+        self.D = D
+        self.energy = energy
+
+        # Times are kept as integer milliseconds; plain Python numbers are
+        # much faster than numpy ones one at a time.
+        self.last_time = None
+        self.eps_sum, self.eps_count = 0., 0
+
+    @property
+    def eps_mean(self):
+        '''The mean of all epsilon values seen so far.'''
+        return self.eps_sum/self.eps_count if self.eps_count else np.nan
+
+    def update(self, time, eps):
+        '''
+        Add one point: epsilon value *eps* at *time*, a datetime64 value or
+        integer milliseconds since 1970.  Returns the onset time as a
+        datetime64 if this point triggers a substorm, otherwise **None**.
+        '''
+
+        if eps != eps:
+            # NaN is the only value not equal to itself.
+            return None
+        if not isinstance(time, int):
+            time = int(np.datetime64(time, 'ms').astype(np.int64))
+        eps = float(eps)
+
+        self.eps_sum += eps
+        self.eps_count += 1
+
+        last, self.last_time = self.last_time, time
+        if self.energy is None:
+            self.energy = -self.D*3600. * eps
+            return None
+        if last is None:
+            return None
+
+        # Same integration step and reset as in run_msm:
+        self.energy = self.energy + eps*((time - last)/1000.)
+        if self.energy >= 0:
+            self.energy = -self.D*3600. * eps
+            return np.datetime64(time, 'ms')
+
+        return None
+
+    def feed(self, imf):
+        '''
+        Add all of the points in ImfData object *imf*, which must come after
+        the points already seen.  Returns an array of onset times.
+        '''
+
+        time, eps = imf['time'], imf['epsilon']
+        good = ~np.isnan(eps)
+        if not good.all():
+            time, eps = time[good], eps[good]
+        if eps.size == 0:
+            return time[:0]
+
+        self.eps_sum += eps.sum()
+        self.eps_count += eps.size
+
+        # Join our last point to the new ones so that the step between
+        # them is included.  Its epsilon is only used for a reset at that
+        # point, which can't happen, so any value will do.
+        if self.last_time is not None:
+            time = np.concatenate([[np.datetime64(self.last_time, 'ms')],
+                                   time])
+            eps = np.concatenate([[0.], eps])
+        gain = eps[1:] * (np.diff(time) / np.timedelta64(1, 's'))
+
+        energy, onsets = _integrate(eps, gain, np.cumsum(gain), self.D,
+                                    self.energy)
+
+        self.energy = float(energy[-1])
+        self.last_time = int(time[-1].astype(np.int64))
+
+        return time[onsets]
+
+    def save(self, filename):
+        '''
+        Save our state to checkpoint file *filename*.  The file is written
+        in full before it replaces any old checkpoint, so a crash while
+        saving never leaves a broken file behind.
+        '''
+
+        temp = f'{filename}.{os.getpid()}.tmp'
+        with open(temp, 'wb') as f:
+            np.savez(f, D=self.D, eps_sum=self.eps_sum,
+                     eps_count=self.eps_count,
+                     energy=np.nan if self.energy is None else self.energy,
+                     last_time=-1 if self.last_time is None
+                     else self.last_time)
+        os.replace(temp, filename)
+
+    @classmethod
+    def load(cls, filename):
+        '''
+        Create a new MSMState from checkpoint file *filename* (see *save*.)
+        '''
+
+        with np.load(filename) as ckpt:
+            state = cls(float(ckpt['D']))
+            state.eps_sum = float(ckpt['eps_sum'])
+            state.eps_count = int(ckpt['eps_count'])
+            if not np.isnan(ckpt['energy']):
+                state.energy = float(ckpt['energy'])
+            if ckpt['last_time'] >= 0:
+                state.last_time = int(ckpt['last_time'])
+
+        return state
+
+
+# Worker processes in a sweep keep the MSM inputs here so that they are
+# sent to each worker once rather than once per value of D.
+_sweep_inputs = None
+
+
+def _init_sweep(inputs):
+    '''Store the MSM inputs in a sweep worker process.'''
+    global _sweep_inputs
+    _sweep_inputs = inputs
+
+
+def _sweep_one(D):
+    '''Run one MSM in a sweep worker; return only the onset indexes.'''
+    return np.array(_integrate(*_sweep_inputs, D)[1], dtype=np.intp)
+
+
+def sweep_msm(imf, Ds, workers=1):
+    '''
+    Run the MSM for every substorm time constant (in hours) in *Ds* using
+    solar wind data *imf*, either an ImfData object or the name of an IMF
+    file.  The file is read and epsilon is calculated only once.  Use
+    kwarg *workers* to spread the runs over a pool of processes (**None**
+    uses one per CPU.)
+
+    Returns a dictionary of arrays with one entry per value of D:
+    'D', 'count' (number of onsets), 'rate' (onsets per day), the mean,
+    median, standard deviation, minimum, and maximum waiting time between
+    onsets in hours ('wait_mean', 'wait_median', 'wait_std', 'wait_min',
+    and 'wait_max'; NaN if there are fewer than two onsets), and 'epochs',
+    a list holding the array of onset times for each D.
+    '''
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    if not isinstance(imf, ImfData):
+        imf = ImfData(imf)
+
+    Ds = np.atleast_1d(np.asarray(Ds, dtype=float))
+    good, inputs = _msm_inputs(imf)
+
+    if workers == 1 or Ds.size < 2:
+        onsets = [_integrate(*inputs, D)[1] for D in Ds]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_sweep,
+                                 initargs=(inputs,)) as pool:
+            onsets = list(pool.map(_sweep_one, Ds, chunksize=8))
+
+    # Build our table.  Onsets count only the good points:
+    time = imf['time']
+    ndays = (time[-1]-time[0]) / np.timedelta64(1, 'D') if time.size else 0
+    goodtime = time[good]
+    table = {'D': Ds, 'count': np.array([len(i) for i in onsets]),
+             'epochs': [goodtime[i] for i in onsets]}
+    table['rate'] = table['count'] / ndays if ndays else \
+        np.full(Ds.size, np.nan)
+
+    stats = {'wait_mean': np.mean, 'wait_median': np.median,
+             'wait_std': np.std, 'wait_min': np.min, 'wait_max': np.max}
+    for name in stats:
+        table[name] = np.full(Ds.size, np.nan)
+    for j, epochs in enumerate(table['epochs']):
+        if epochs.size < 2:
+            continue
+        wait = np.diff(epochs) / np.timedelta64(1, 'h')
+        for name, func in stats.items():
+            table[name][j] = func(wait)
+
+    return table
+
+
+def write_sweep(filename, table, imffile):
+    '''
+    Write the results of *sweep_msm*, *table*, to file *filename* as one
+    line per value of D.  The name of the IMF file used, *imffile*, is
+    recorded in the header.
+    '''
+
+    cols = ['D', 'count', 'rate', 'wait_mean', 'wait_median', 'wait_std',
+            'wait_min', 'wait_max']
+    with open(filename, 'w') as f:
+        f.write('MSM parameter sweep; D and waiting times in hours, rate in '
+                'onsets per day\n')
+        f.write(f'Input file used: {imffile}\n')
+        f.write(' '.join(f'{c:>11s}' for c in cols) + '\n')
+        for j in range(table['D'].size):
+            f.write(' '.join(f'{table[c][j]:11.4f}' if c != 'count' else
+                             f'{table[c][j]:11d}' for c in cols) + '\n')
+
+
+def write_epochs(filename, epochs, imffile):
+    '''
+    Write the onset times, *epochs*, to file *filename*.  The name of the
+    IMF file used, *imffile*, is recorded in the header.
+    '''
+
+    # Note that we're using the "with" statement.  See sciprog.py for
+    # details on this.  Note how we end each line with a newline character
+    # (\n).
+    with open(filename, 'w') as f:
+        f.write('Substorm onsets created from the Minimal Substorm Model '
+                '(MSM)\n')
+        f.write(f'Input file used: {imffile}\n')
+        for e in epochs.astype(object):
+            f.write(f'{e:%Y-%m-%d %H:%M:%S} UT \n')
+
+
+def plot_msm(imf, energy, epochs, outname=None,
+             style='seaborn-v0_8-darkgrid'):
+    '''
+    Plot solar wind power from ImfData object *imf* and the tail *energy*
+    and onset times, *epochs*, from *run_msm*.  If kwarg *outname* is given,
+    the plot is saved to that file instead of shown on screen.  The
+    Matplotlib style sheet can be set with the keyword *style*.
+    '''
+
+    import matplotlib.pyplot as plt
+
+    # Set our plotting style:
+    plt.style.use(style)
+
+    # Create figure object and axes objects.
+    fig = plt.figure()
+    a1, a2 = fig.add_subplot(211), fig.add_subplot(212)
+
+    # Create line plots:
+    a1.plot(imf['time'], imf['epsilon'], 'r-', lw=2)
+    a2.plot(imf['time'], energy,          '-', lw=2)
+
+    # Create and label horizontal threshold line:
+    a2.text(imf['time'][0], 0.05, 'Substorm Energy Threshold')
+    a2.hlines(0.0, imf['time'][0], imf['time'][-1], linestyles='dashed',
+              lw=2.0)
+
+    # Place epochs onto plot, preserving y-limits.
+    ymin, ymax = a2.get_ylim()                 # get current axis limits.
+    ymax = .2                                  # add some space above zero.
+    a2.vlines(epochs, ymin, ymax, colors='k')  # add our vlines.  This changes limits...
+    a2.set_ylim([ymin, ymax])                  # restore ylimits to good values.
+
+    # Y-axes labels:
+    a1.set_ylabel('Solar Wind Power', size=14)
+    a2.set_ylabel('Tail Energy State', size=14)
+
+    # Y-axis ticks:
+    a1.set_yticklabels('')
+    a2.set_yticklabels('')
+
+    # Set time ticks:
+    smartTimeTicks(a1, imf['time'])
+    smartTimeTicks(a2, imf['time'], True)
+
+    fig.tight_layout()
+
+    # Finally, either save or show the plot.
+    if outname:
+        fig.savefig(outname)
+    else:
+        plt.show()
+
+    return fig
+
+
+def _ensemble_one(job):
+    '''
+    Run the MSM for one file of an ensemble; *job* is a tuple of the IMF
+    file name, D, the epoch file to write, and the histogram bin edges.
+    Only small summaries are returned, never the energy array.
+    '''
+
+    imffile, D, outfile, bins = job
+    imf = ImfData(imffile)
+    epochs = run_msm(imf, D)[1]
+    write_epochs(outfile, epochs, imffile)
+
+    time = imf['time']
+    days = (time[-1]-time[0]) / np.timedelta64(1, 'D') if time.size else 0.
+
+    # Longer waits than the last bin edge go in the last bin:
+    wait = np.diff(epochs) / np.timedelta64(1, 'h')
+    hist = np.histogram(np.minimum(wait, bins[-1]), bins)[0]
+
+    return epochs.size, days, hist
+
+
+def run_ensemble(imffiles, D=2.69, outdir='.', workers=None,
+                 bins=np.arange(0, 49)):
+    '''
+    Run the MSM with time constant *D* (hours) for each file in list
+    *imffiles* using a pool of *workers* processes (defaults to one per
+    CPU; use 1 to run in this process.)  The onsets for each file are saved
+    to their own file in directory *outdir*, named after the IMF file,
+    e.g., "imf_jul2000_epochs.txt".
+
+    Returns a dictionary with the list of 'files' and epoch files
+    ('outputs'), arrays of the number of onsets ('count'), days of data
+    ('days'), and onset rate per day ('rate') for each file, the onset
+    rate over all files ('total_rate'), and a histogram of waiting times
+    between onsets in hours over all files ('hist', with bin edges 'bins';
+    set with kwarg *bins*.  Longer waits are counted in the last bin.)
+    '''
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    imffiles = list(imffiles)
+    bins = np.asarray(bins, dtype=float)
+    os.makedirs(outdir, exist_ok=True)
+
+    # Name each output after its input file.  Files with the same name
+    # (e.g., from different directories) get a number added.
+    names = [os.path.splitext(os.path.basename(f))[0] for f in imffiles]
+    outputs = []
+    for i, name in enumerate(names):
+        if names.count(name) > 1:
+            name = f'{name}_{i:03d}'
+        outputs.append(os.path.join(outdir, name + '_epochs.txt'))
+
+    jobs = [(f, D, out, bins) for f, out in zip(imffiles, outputs)]
+    if workers == 1 or len(jobs) < 2:
+        results = [_ensemble_one(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_ensemble_one, jobs))
+
+    # Combine results from each file:
+    ensemble = {'files': imffiles, 'outputs': outputs, 'bins': bins,
+                'count': np.array([r[0] for r in results], dtype=int),
+                'days': np.array([r[1] for r in results], dtype=float),
+                'hist': np.zeros(bins.size-1, dtype=int)}
+    for r in results:
+        ensemble['hist'] += r[2]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ensemble['rate'] = ensemble['count'] / ensemble['days']
+        ensemble['total_rate'] = ensemble['count'].sum() / \
+            ensemble['days'].sum()
+
+    return ensemble
+
+
+def write_ensemble(filename, ensemble, D):
+    '''
+    Write a summary of the results of *run_ensemble*, *ensemble*, run with
+    time constant *D*, to file *filename*.
+    '''
+
+    with open(filename, 'w') as f:
+        f.write(f'MSM ensemble with D = {D} hours over '
+                f'{len(ensemble["files"])} files\n')
+        f.write(f'Onsets per day over all files: '
+                f'{ensemble["total_rate"]:.4f}\n')
+        f.write('Onsets, days, onsets per day, and file:\n')
+        for name, n, days, rate in zip(ensemble['files'], ensemble['count'],
+                                       ensemble['days'], ensemble['rate']):
+            f.write(f'{n:6d} {days:10.4f} {rate:8.4f} {name}\n')
+        f.write('Waiting time histogram (hours from, to, number of '
+                'waits):\n')
+        bins = ensemble['bins']
+        for lo, hi, n in zip(bins[:-1], bins[1:], ensemble['hist']):
+            f.write(f'{lo:8.2f} {hi:8.2f} {n:6d}\n')
+
+
+# Code below only runs when this file is run as a script, not when it is
+# imported, e.g., "from msm import run_msm".
+if __name__ == '__main__':
+    # The argparse module handles input arguments from the unix shell
+    # command line interface.  We'll cover this more during our
+    # scripting section.
+    from argparse import ArgumentParser
+
+    # Handle all arguments first before performing the rest
+    # of the script.  Start by creating the parser object and using the
+    # docstring as our help message.
+    parser = ArgumentParser(description=__doc__)
+
+    # Now, for each argument/option, add it to the parser and add help info.
+    # Documentation of argparse is found here: https://docs.python.org/3/library/argparse.html
+    # ...and a good tutorial is found here: https://docs.python.org/3/howto/argparse.html
+    # Note how we use argparse to set defaults!
+    parser.add_argument('imffile', help='The name of the IMF input file to '
+                        'read.  If more than one is given, the MSM is run for '
+                        'each one, without plots (see --outdir.)', type=str,
+                        nargs='+')
+    parser.add_argument('-D', '--D', help='Value of the substorm time '
+                        'constant. Defaults to 2.69 hours.', type=float,
+                        default=2.69)
+    parser.add_argument('-s', '--sweep', help='Instead of a single run, run '
+                        'the MSM for NUM values of D from START to STOP '
+                        'hours and save a table of results (see --outdir '
+                        'and --output.)',
+                        type=float, nargs=3, metavar=('START', 'STOP', 'NUM'))
+    parser.add_argument('-w', '--workers', help='Number of processes to use '
+                        'for a sweep or many files. Defaults to 1; 0 uses '
+                        'one per CPU.', type=int, default=1)
+    parser.add_argument('-o', '--outdir', help='Directory in which to save '
+                        'results. For many input files, an epoch file is '
+                        'saved for each plus a summary, msm_ensemble.txt. '
+                        'Defaults to the current directory.', default='.')
+    parser.add_argument('--output', help='Name of the file, inside of '
+                        '--outdir, to which onset times (or the sweep table) '
+                        'are saved. Defaults to substorm_epochs.txt (or '
+                        'msm_sweep.txt for a sweep.)')
+    parser.add_argument('--no-plot', help='Skip the plot; Matplotlib is never '
+                        'loaded.', action='store_true')
+
+    # Get args from caller, collect arguments into a convenient object:
+    args = parser.parse_args()
+
+    # With many files, run the ensemble and stop: no plots.
+    if len(args.imffile) > 1:
+        if args.sweep:
+            parser.error('Sweeps only work with one file.')
+        ensemble = run_ensemble(args.imffile, args.D, args.outdir,
+                                args.workers or None)
+        write_ensemble(os.path.join(args.outdir, 'msm_ensemble.txt'),
+                       ensemble, args.D)
+        raise SystemExit
+    args.imffile = args.imffile[0]
+
+    # Open data file.
+    imf = ImfData(args.imffile)
+    os.makedirs(args.outdir, exist_ok=True)
+
+    # For a sweep, save the table of results and stop: no plots.
+    if args.sweep:
+        start, stop, num = args.sweep
+        table = sweep_msm(imf, np.linspace(start, stop, int(num)),
+                          args.workers or None)
+        write_sweep(os.path.join(args.outdir, args.output or 'msm_sweep.txt'),
+                    table, args.imffile)
+        raise SystemExit
+
+    # Run the model.  Note how we obtain the value of D from "args", set by
+    # argparse.
+    energy, epochs = run_msm(imf, args.D)
+
+    # Save epochs to file.
+    write_epochs(os.path.join(args.outdir,
+                              args.output or 'substorm_epochs.txt'),
+                 epochs, args.imffile)
+
+    if not args.no_plot:
+        plot_msm(imf, energy, epochs)
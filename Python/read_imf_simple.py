@@ -20,6 +20,8 @@ import numpy as np
 import datetime as dt
 import matplotlib.pyplot as plt
 
+from sciprog import skip_imf_header, parse_imf_data, imf_vars
+
 
 def read_imf_simple(infile, debug=False):
     '''
@@ -54,8 +56,12 @@ def read_imf_simple(infile, debug=False):
     # Let's loop through the first lines until we hit that line.
     # When comparing two strings, we want to cut off leading and trailing
     # blanks.  We do that with the "strip" object method.
+    # If we hit the end of the file first, "readline" gives us an empty
+    # string.  Stop there rather than looping forever!
     while line.strip() != '#START':
         line = f.readline()
+        if not line:
+            raise ValueError(f'No "#START" line found in {infile}.')
 
     # DEBUG:
     if debug:
@@ -118,7 +124,7 @@ def read_imf_simple(infile, debug=False):
                                       int(parts[3]),  # hour
                                       int(parts[4]),  # minute
                                       int(parts[5]),  # second
-                                      int(parts[6])/1000  # microsec
+                                      int(parts[6])*1000  # ms->microsec
                                       )
 
         # We can now go through the rest of the parts and put them into
@@ -170,57 +176,33 @@ def read_imf(infile, debug=False):
     # https://docs.python.org/3/reference/compound_stmts.html#with
     # We will use "with" in the reimplementation of this (below).
 
-    # Open file, parse header, slurp lines:
+    # Open file, parse header, parse data.  The header skipping and the
+    # bulk parsing are shared with the sciprog module so that every reader
+    # in the course uses the same (fast) engine:
     with open(infile, 'r') as f:
-        # Get first line:
-        line = f.readline()
-
-        # Skip our header:
-        while '#START' not in line:
-            line = f.readline()
+        # Skip our header, collecting header information:
+        meta = skip_imf_header(f)
 
         # DEBUG:
         if debug:
-            print(f'DEBUG: Our last header line was {line}')
+            print(f'DEBUG: Our header information was {meta}')
 
-        # Slurp remainder.
-        lines = f.readlines()
-
-    # How many lines do we have?  The "len()" function will tell us!
-    nLines = len(lines)
+        # Parse remainder all at once.
+        time, values = parse_imf_data(f)
 
     # Now we can make a container for our data.
-    data = {}  # empty dictionary.
-    keys = ['bx', 'by', 'bz', 'vx', 'vy', 'vz', 'rho', 'temp']
-    data['time'] = np.zeros(nLines, dtype=object)  # a vector of time objects!
-    # All other values as a vector of floats:
-    for k in keys:
-        data[k] = np.zeros(nLines)
+    data = {'time': time}
+
+    # A much more "pythonic" way (elegant in the python style) is to
+    # simultaneously iterate over both your keys and values at once:
+    for k, v in zip(imf_vars, values):
+        data[k] = v
 
     if debug:
         print('DEBUG: Our data dictionary looks like this:')
         for key in data:
             print(f'\t{key}:\t{data[key]}')
 
-    # Now, to parse:
-    for i, l in enumerate(lines):
-        # Split up the line into parts:
-        parts = l.split()
-
-        # Use the datetime.strptime method to build straight
-        # from the string.  Note that we don't always know how much white
-        # space there will be between entries, so let's rebuild the string
-        # from our parts list:
-        tNow = ' '.join(parts[:6])
-        data['time'][i] = dt.datetime.strptime(tNow, '%Y %m %d %H %M %S')
-        # These format codes are described here:
-        # https://docs.python.org/2/library/datetime.html#strftime-and-strptime-behavior
-
-        # A much more "pythonic" way (elegant in the python style) is to
-        # simultaneously iterate over both your keys and values at once:
-        for k, p in zip(keys, parts[7:]):
-            data[k][i] = p
-
     # Return data to user.
     return data
 
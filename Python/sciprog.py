@@ -20,12 +20,40 @@ Next, import the module:
 
 # It is good practice to put most imports at the top of the file.
 # Exceptions may be made for modules that are only used for one function.
+import os
+import operator
 import numpy as np
-import matplotlib.pyplot as plt
+
+# Matplotlib is slow to import and may start up a GUI, so it is only
+# imported inside the functions that plot.  Code that only reads or
+# calculates (e.g., worker processes) never pays for it.
 
 # If there are top level parameters or constants, declaring them next is
 # a good idea from an organizational standpoint.
 
+# Names of the data columns, in order, that follow the date and time
+# columns in SWMF-formatted IMF files:
+imf_vars = ['bx', 'by', 'bz', 'vx', 'vy', 'vz', 'rho', 'temp']
+
+# Values used in place of missing data by ACE and OMNI files.  These are
+# replaced by NaN when data is loaded (see ImfData.mask.)  Careful: values
+# like -999.9 are real solar wind speeds during big storms!
+imf_fill_values = [9999.99, -9999.99, 99999.9, -99999.9, 9999999.,
+                   1e31, -1e31]
+
+# Time steps longer than this many times the typical step are gaps:
+gap_factor = 1.5
+
+# Default location for binary copies of parsed IMF files (see ImfData).
+# Bump the version number whenever the layout of cached files changes so
+# that old entries are never loaded by mistake.
+cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'sciprog')
+cache_version = 3
+
+# Number of values handled at once by the ImfData.calc_* methods.  Working
+# on small blocks keeps scratch arrays small enough to stay in CPU cache.
+calc_block_size = 2**16
+
 # Now, we'll declare functions:
 
 
@@ -66,8 +94,9 @@ def format_ax(ax, ylabel=None):
     ax.xaxis.set_minor_locator(mtick)
     ax.xaxis.set_major_formatter(fmt)
 
-    # Turn on the grid:
-    ax.grid()
+    # Turn on the grid.  Saying "True" keeps a second call from turning
+    # it back off.
+    ax.grid(True)
 
     # Set ylabel, if set:
     if ylabel:
@@ -114,7 +143,9 @@ def smartTimeTicks(ax, time, do_label=False):
                                   DayLocator, DateFormatter)
 
     # Get time between first and last time entry, convert to hours.
-    deltaT = time[-1] - time[0]
+    # Only the end points are needed, so convert just those to datetimes.
+    tStart, tEnd = to_datetime(time[0]), to_datetime(time[-1])
+    deltaT = tEnd - tStart
     nHours = deltaT.days * 24.0 + deltaT.seconds/3600.0
 
     # Based on number of hours, select frequency of ticks.
@@ -138,7 +169,258 @@ def smartTimeTicks(ax, time, do_label=False):
 
     # Add label if requested to do so:
     if do_label:
-        ax.set_xlabel(time[0].strftime('%h %d, %Y  %H:%M'), size=16)
+        ax.set_xlabel(tStart.strftime('%h %d, %Y  %H:%M'), size=16)
+
+
+def decimate_minmax(x, y, nbins):
+    '''
+    Pick which points of a line, *x* (sorted) vs. *y*, to draw when only
+    *nbins* pixels are available across the x range.  The x range is split
+    into *nbins* equal bins; only the smallest and largest value in each
+    bin are kept, so spikes and the overall shape survive while the number
+    of points drawn stays under 2*nbins (plus the end points.)  Bins
+    holding bad (NaN) values keep one so the line still breaks at gaps.
+
+    Returns the sorted indexes of the points to keep.
+    '''
+
+    x, y = np.asarray(x), np.asarray(y)
+    n = x.size
+    if n <= 2*nbins + 2:
+        return np.arange(n)
+
+    # Find the bin of every point:
+    span = x[-1] - x[0]
+    ibin = ((x - x[0]) * (nbins / span)).astype(np.intp) if span > 0 \
+        else np.zeros(n, dtype=np.intp)
+    np.clip(ibin, 0, nbins-1, out=ibin)
+
+    # Points are sorted, so each bin is a run of points.  Find the start of
+    # each run, then the smallest and largest values in each ("fmin" and
+    # "fmax" skip NaNs.)
+    starts = np.flatnonzero(np.r_[True, ibin[1:] != ibin[:-1]])
+    count = np.diff(np.r_[starts, n])
+    keep = [[0, n-1]]
+    for func in (np.fmin, np.fmax):
+        extreme = np.repeat(func.reduceat(y, starts), count)
+        # Keep the first point in each bin that matches:
+        hit = np.flatnonzero(y == extreme)
+        keep.append(hit[np.r_[True, ibin[hit][1:] != ibin[hit][:-1]]])
+
+    # Also keep the first bad value in each bin:
+    bad = np.flatnonzero(np.isnan(y))
+    if bad.size:
+        keep.append(bad[np.r_[True, ibin[bad][1:] != ibin[bad][:-1]]])
+
+    return np.unique(np.concatenate(keep))
+
+
+class DecimatedLine(object):
+    '''
+    A line on axes *ax* that only draws as many points as there are pixels
+    (see *decimate_minmax*.)  Whenever the x limits change, e.g., when
+    zooming in an interactive window, the visible part of the line is
+    decimated again from the full-resolution data, *x* vs. *y*.  *x* may
+    be datetime64 values; they are converted to Matplotlib date numbers
+    once.  Other arguments and kwargs are handed to ax.plot.
+
+    The Matplotlib line object is stored as self.line.
+    '''
+
+    def __init__(self, ax, x, y, *args, **kwargs):
+        import matplotlib.dates as mdt
+
+        x = np.asarray(x)
+        if np.issubdtype(x.dtype, np.datetime64):
+            x = mdt.date2num(x)
+            ax.xaxis_date()
+        self.ax, self.x, self.y = ax, x, np.asarray(y)
+
+        keep = decimate_minmax(self.x, self.y, self.npix())
+        self.line, = ax.plot(self.x[keep], self.y[keep], *args, **kwargs)
+
+        # Matplotlib only keeps weak references to callbacks, so keep this
+        # object alive as long as its line is:
+        self.line.decimator = self
+        ax.callbacks.connect('xlim_changed', self.update)
+
+    def npix(self):
+        '''Width of our axes in pixels, i.e., the number of bins to use.'''
+        return max(int(self.ax.bbox.width), 1)
+
+    def update(self, ax=None):
+        '''Decimate the visible part of the line again.'''
+        x0, x1 = self.ax.get_xlim()
+
+        # Include one point on either side so the line reaches the edges:
+        i0 = max(np.searchsorted(self.x, x0, side='left') - 1, 0)
+        i1 = np.searchsorted(self.x, x1, side='right') + 1
+        x, y = self.x[i0:i1], self.y[i0:i1]
+
+        keep = decimate_minmax(x, y, self.npix())
+        self.line.set_data(x[keep], y[keep])
+
+
+def skip_imf_header(f):
+    '''
+    Given an open SWMF IMF file object, *f*, read lines until the "#START"
+    line is found.  The file pointer is left at the first line of data.
+    Files may be opened in either text or binary mode.
+
+    The header lines are parsed as they are read and returned as a
+    dictionary (see *parse_imf_header*.)  If the file ends before "#START"
+    is found (e.g., a truncated download), a ValueError is raised.
+    '''
+
+    header = []
+    while True:
+        line = f.readline()
+
+        # At the end of a file, "readline" returns an empty string forever.
+        # Note that blank lines in the file are NOT empty: they hold '\n'.
+        if not line:
+            name = getattr(f, 'name', 'file')
+            raise ValueError(f'No "#START" line found in {name}.')
+
+        # Files opened in binary mode give us bytes instead of strings:
+        if isinstance(line, bytes):
+            line = line.decode()
+
+        # Stop at the end of the header; save everything else.
+        if line.strip() == '#START':
+            break
+        header.append(line.rstrip('\r\n'))
+
+    return parse_imf_header(header)
+
+
+def parse_imf_header(lines):
+    '''
+    Parse the list of SWMF IMF header *lines* (everything above "#START")
+    into a dictionary.  The dictionary contains:
+
+    header   -- The list of header lines, unchanged.
+    comments -- Non-blank lines of free text that aren't in a "#" block.
+    created  -- The creation date (a datetime), if a line starts with
+                "File created on".
+    ...      -- For each "#BLOCK" in the header, the lines that follow it,
+                e.g., meta['coor'] = 'GSM'.  Blocks with a single line are
+                given as a string; others as a list of strings.
+    '''
+
+    import datetime as dt
+
+    meta = {'header': list(lines), 'comments': []}
+
+    # Blocks start with a "#NAME" line and end with a blank line:
+    block = None
+    for line in lines:
+        text = line.strip()
+        if text.startswith('#') and len(text) > 1:
+            block = text[1:].split()[0].lower()
+            meta[block] = []
+        elif not text:
+            block = None
+        elif block:
+            meta[block].append(text)
+        else:
+            meta['comments'].append(text)
+
+            # Files from the SWMF tools carry a time stamp:
+            if text.startswith('File created on'):
+                try:
+                    meta['created'] = dt.datetime.fromisoformat(
+                        text[len('File created on'):].strip())
+                except ValueError:
+                    pass
+
+    # Simplify blocks with a single value:
+    for key, value in meta.items():
+        if key not in ('header', 'comments') and isinstance(value, list) \
+           and len(value) == 1:
+            meta[key] = value[0]
+
+    return meta
+
+
+def build_imf_time(parts):
+    '''
+    Given an integer array, *parts*, of shape (nLines, 7) holding the
+    year, month, day, hour, minute, second, and millisecond columns of an
+    IMF file, build all of the time values at once.  A *datetime64* array
+    with millisecond resolution is returned.
+    '''
+
+    # Numpy's "datetime64" type lets us do calendar math on whole arrays.
+    # Build the date by truncating to years, then months, then days, adding
+    # each offset as we go.  Years are counted from 1970, the Unix epoch.
+    yy, mm, dd, hh, mn, ss, ms = parts[:, :7].T
+    time = (yy - 1970).astype('datetime64[Y]').astype('datetime64[M]') + mm-1
+    time = time.astype('datetime64[D]') + dd-1
+
+    # Add the time of day in milliseconds:
+    return time.astype('datetime64[ms]') + ((hh*60 + mn)*60 + ss)*1000 + ms
+
+
+def to_datetime(time):
+    '''
+    Convert *time*, a *datetime64* value or array, into Python datetime
+    objects.  Values that are already datetimes are returned unchanged.
+    '''
+
+    import datetime as dt
+
+    # Scalar values:
+    if isinstance(time, dt.datetime):
+        return time
+    if isinstance(time, np.datetime64):
+        return time.astype('datetime64[us]').item()
+
+    # Arrays.  Microsecond resolution converts to datetime objects:
+    time = np.asarray(time)
+    if time.dtype == object:
+        return time
+    return time.astype('datetime64[us]').astype(object)
+
+
+def parse_imf_data(f, dtype=np.float64, variables=None):
+    '''
+    Parse every remaining line of the open SWMF IMF file object, *f*, in a
+    single bulk pass.  The file pointer should already be past the header
+    (see *skip_imf_header*.)  Alternatively, *f* may be a list of data lines.
+
+    Two values are returned: a *datetime64* array of times and a 2D array
+    of floats with one row per variable in *imf_vars*.  The type of the
+    floats is set by kwarg *dtype*.  To only convert some of the variables,
+    give a list of their names as kwarg *variables*; the rows of the 2D
+    array then follow the order of that list.
+    '''
+
+    # Find the columns we want.  The first 7 are always time.
+    if variables is None:
+        variables = imf_vars
+    for v in variables:
+        if v not in imf_vars:
+            raise ValueError(f'Unknown IMF variable: {v}')
+    cols = list(range(7)) + [7 + imf_vars.index(v) for v in variables]
+
+    # Rather than splitting and converting one line at a time, let Numpy
+    # convert the whole table of numbers in compiled code.  Note that even
+    # 32-bit floats hold our integer date and time columns exactly.
+    raw = np.loadtxt(f, ndmin=2, dtype=dtype, usecols=cols)
+
+    # Handle files with a header but no data:
+    if raw.size == 0:
+        raw = np.zeros((0, len(cols)), dtype=dtype)
+
+    # Time is held in the first 7 columns:
+    time = build_imf_time(raw[:, :7].astype(np.int64))
+
+    # Everything else is data.  Transpose and copy so that each variable
+    # is its own contiguous row:
+    values = np.ascontiguousarray(raw[:, 7:].T)
+
+    return time, values
 
 
 def read_imf(infile, debug=False):
@@ -158,49 +440,11 @@ def read_imf(infile, debug=False):
     useful!
     '''
 
-    # In python, we import useful modules first.  If the module names
-    # are long, we can give them aliases.  All the functions, classes,
-    # etc. inside of that loaded module are preceeded by the module name
-    # or alias.
-    import numpy as np
-    import datetime as dt
-
     # Check our arguments, raise "exceptions" (errors) if something is wrong.
     if not isinstance(infile, str):
         raise TypeError('Input file name must be a string.')
 
-    # Open the file in read-only mode by creating a file object.
-    f = open(infile, 'r')
-
-    # Read the very first line.  Just like IDL, Python will remember our
-    # position in the file so that no lines are read twice.
-    line = f.readline()
-
-    # These files have a lot of header information.  We want to skip that.
-    # We know, a priori, that the data begins after the "#START" text.
-    # Let's loop through the first lines until we hit that line.
-    # When comparing two strings, we want to cut off leading and trailing
-    # blanks.  We do that with the "strip" object method.
-    while line.strip() != '#START':
-        line = f.readline()
-
-    # DEBUG:
-    if debug:
-        print(f'DEBUG: Our last header line was {line}')
-
-    # At this point, we should be at the line where the data starts.
-    # We can load the rest of the lines by using the "readlines()" (note the
-    # s) to slurp all remaining lines.  Slurp is a term that means "read the
-    # whole damn file."
-    lines = f.readlines()
-
-    # We're now done with this file, so close it.
-    f.close()
-
     # AN IMPORTANT NOTE: THE "WITH" STATEMENT.
-    # We could, alternatively, use this syntax to open/read the file:
-    # with open(infile, 'r') as f:
-    #     *do everything here up to f.close()*
     # "with" is a code block used to wrap actions that have distinct
     # "enter" and "exit" actions.  For example, when we open a file,
     # the enter action is to create a file object that is connected to
@@ -210,78 +454,36 @@ def read_imf(infile, debug=False):
     # exit action.  "with" blocks solve this existential problem.
     # For more information, see:
     # https://docs.python.org/3/reference/compound_stmts.html#with
-    # We will use "with" in the reimplementation of this (below).
+    with open(infile, 'r') as f:
+        # These files have a lot of header information.  We want to skip
+        # that.  We know, a priori, that the data begins after the "#START"
+        # text.  The header is parsed as it is skipped.
+        meta = skip_imf_header(f)
 
-    # How many lines do we have?  The "len()" function will tell us!
-    nLines = len(lines)
+        # DEBUG:
+        if debug:
+            print(f'DEBUG: Our header information was {meta}')
+
+        # Parse the rest of the file.  Looping over every line, splitting
+        # it, and converting each piece one at a time is very slow for
+        # big files.  Instead, we hand the whole block of numbers to Numpy.
+        time, values = parse_imf_data(f)
 
     # Now we can make a container for our data.  Our container will be a
     # dictionary.  Each variable (time, bx, by, etc.) will be an key with
-    # the corresponding value a vector of values.  One way to set it up is:
-    data = {}  # empty dictionary.
-    keys = ['bx', 'by', 'bz', 'vx', 'vy', 'vz', 'rho', 'temp']
-    data['time'] = np.zeros(nLines, dtype=object)  # a vector of time objects!
-    for k in keys:
-        data[k] = np.zeros(nLines)  # a vector of floats!
+    # the corresponding value a vector of values.
+    data = {'time': time}
+
+    # A "pythonic" way (elegant in the python style) to fill the dictionary
+    # is to simultaneously iterate over both your keys and values at once:
+    for k, v in zip(imf_vars, values):
+        data[k] = v
 
     if debug:
         print('DEBUG: Our data dictionary looks like this:')
         for key in data:
             print(f'\t{key}:\t{data[key]}')
 
-    # We now have a container of the correct size and type for all our values.
-    # We knew the keys a priori; it's possible and easy to get the list of
-    # values from the file if it's listed in the file.
-
-    # Now, to parse.  This is just a matter of splitting the line into parts,
-    # turning them into floats or ints.  Special care must be taken with time
-    # because we want datetime objects (Python's special time variables.)
-    # Start by looping through all lines:
-    for i, l in enumerate(lines):
-        # Split up the line into parts:
-        parts = l.split()
-        # Handle time first.  We need the first 7 values from the line (year
-        # through milisecond) and we need to turn them into ints and hand them
-        # to the datetime module to make a datetime object.  We put the
-        # datetime object into our time vector like so:
-        # METHOD ONE: BRUTE FORCE.  When all else fails, do this:
-        # for each part of the date and time, convert the string into an
-        # integer, and use them to build the datetime object by hand.
-        # data['time'][i]=dt.datetime(int(parts[0]), #year
-        #                             int(parts[1]), #month
-        #                             int(parts[2]), #day
-        #                             int(parts[3]), #hour
-        #                             int(parts[4]), #minute
-        #                             int(parts[5]), #second
-        #                             int(parts[6])/1000 #microsec
-        #                             )
-        # Looks contrived?  Wait until you see what is required in IDL.
-        # METHOD TWO: Use the datetime.strptime method to build straight
-        # from the string.  Note that we don't always know how much white
-        # space there will be between entries, so let's rebuild the string
-        # from our parts list:
-        tNow = ' '.join(parts[:6])
-        data['time'][i] = dt.datetime.strptime(tNow, '%Y %m %d %H %M %S')
-        # These format codes are described here:
-        # https://docs.python.org/2/library/datetime.html#strftime-and-strptime-behavior
-
-        # We can now go through the rest of the parts and put them into
-        # the right spots in our arrays.  Loop it!
-        # The "brute force" way to do this would be to do use an index
-        # to get the right value for the right variable name:
-        # for j in range( len(keys) ):
-        #     k = keys[j]    # Get our variable name as a dict key
-        #     p = parts[7+j] # Get value; the 7 is to skip the time variables!
-        #     data[k][i] = p # Put right value in right spot.
-
-        # A much more "pythonic" way (elegant in the python style) is to
-        # simultaneously iterate over both your keys and values at once:
-        for k, p in zip(keys, parts[7:]):
-            data[k][i] = p
-        # With a little dictionary magic and loop fun, we did the entire
-        # variable group in two lines.  Play with the syntax to figure out
-        # how this works (left as an excercise for the reader.)
-
     # That's it!  Our data dictionary is full.  Return it to the user.
     # You could plot a value by typing:
     # >>>import matplotlib.pyplot as plt
@@ -289,7 +491,544 @@ def read_imf(infile, debug=False):
     return data
 
 
-def plot_imf(filename, outname=None, style='seaborn-dark'):
+def iter_imf_chunks(filename, chunk_rows=100000, dtype=np.float64):
+    '''
+    Read SWMF IMF file *filename* a piece at a time.  This is a generator:
+    each iteration yields an ImfData object holding the next *chunk_rows*
+    lines of data (fewer for the last chunk.)  Only one chunk is held in
+    memory at once, so files of any size can be processed.  Kwarg *dtype*
+    sets the float type of the values.
+
+    The calc_* methods work on each chunk.  For example, to get the mean
+    epsilon value of a huge file:
+
+    >>>total, npts = 0, 0
+    >>>for chunk in iter_imf_chunks('huge_file.dat'):
+    >>>    chunk.calc_epsilon()
+    >>>    total += chunk['epsilon'].sum()
+    >>>    npts += chunk['epsilon'].size
+    >>>print(total/npts)
+    '''
+
+    from itertools import islice
+
+    if chunk_rows < 1:
+        raise ValueError('chunk_rows must be at least 1.')
+
+    with open(filename, 'r') as f:
+        meta = skip_imf_header(f)
+
+        while True:
+            # "islice" grabs the next chunk_rows lines from the file without
+            # reading the rest of it:
+            lines = list(islice(f, chunk_rows))
+            if not lines:
+                break
+
+            time, values = parse_imf_data(lines, dtype)
+
+            # Skip chunks with nothing but blank lines:
+            if time.size == 0:
+                continue
+
+            yield ImfData.from_arrays(time, values, filename, meta=meta)
+
+
+def imf_cache_entry(filename, cachedir=None, dtype=np.float64):
+    '''
+    Return the path of the binary cache entry for IMF file *filename* inside
+    of directory *cachedir* (defaults to module-level *cache_dir*.)  Data
+    of different float types, *dtype*, are kept in separate entries.
+
+    The entry name is built from the full path of the file along with its
+    size and modification time.  If the file changes, so does the name, so
+    stale entries are never matched.
+    '''
+
+    import hashlib
+
+    if cachedir is None:
+        cachedir = cache_dir
+
+    # Hash the absolute path so that files with the same name in different
+    # folders don't collide:
+    path = os.path.abspath(filename)
+    pathkey = hashlib.sha1(path.encode()).hexdigest()[:16]
+    pathkey += '-' + np.dtype(dtype).name
+
+    # Add file size and modification time:
+    stat = os.stat(path)
+    name = f'{pathkey}_v{cache_version}_{stat.st_size}_{stat.st_mtime_ns}'
+
+    return os.path.join(cachedir, name)
+
+
+def save_imf_cache(entry, time, values, max_bytes=None, meta=None):
+    '''
+    Save parsed IMF *time* and *values* arrays (see *parse_imf_data*) as
+    binary ".npy" files in cache entry *entry* (see *imf_cache_entry*.)
+    The header lines found in *meta* (see *skip_imf_header*) are saved,
+    too.  Any older entries for the same source file are removed.
+
+    If *max_bytes* is given, the cache directory is pruned to that size
+    afterwards (see *prune_imf_cache*.)
+    '''
+
+    import shutil
+    import tempfile
+
+    cachedir, name = os.path.split(entry)
+    os.makedirs(cachedir, exist_ok=True)
+
+    # Write to a temporary folder first, then rename it into place.  That
+    # way, other processes never see a half-written entry.
+    tmp = tempfile.mkdtemp(prefix='.tmp_', dir=cachedir)
+    np.save(os.path.join(tmp, 'time.npy'), time)
+    np.save(os.path.join(tmp, 'values.npy'), values)
+    with open(os.path.join(tmp, 'header.txt'), 'w') as f:
+        for line in (meta or {}).get('header', []):
+            f.write(line + '\n')
+    try:
+        os.replace(tmp, entry)
+    except OSError:
+        # Somebody else saved this entry first.  Keep theirs.
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    # Remove stale entries for the same file: same path hash, other name.
+    pathkey = name.split('_')[0]
+    for old in os.listdir(cachedir):
+        if old.startswith(pathkey + '_') and old != name:
+            shutil.rmtree(os.path.join(cachedir, old), ignore_errors=True)
+
+    if max_bytes is not None:
+        prune_imf_cache(max_bytes, cachedir)
+
+
+def load_imf_cache(entry):
+    '''
+    Load the time and values arrays and the header information (see
+    *parse_imf_header*) stored in cache entry *entry*.  Arrays are memory
+    mapped, so nothing is read from disk until it is used.  The mapping is
+    "copy-on-write": changing values in memory never changes the cache on
+    disk.
+    '''
+
+    time = np.load(os.path.join(entry, 'time.npy'), mmap_mode='c')
+    values = np.load(os.path.join(entry, 'values.npy'), mmap_mode='c')
+    with open(os.path.join(entry, 'header.txt')) as f:
+        meta = parse_imf_header(f.read().splitlines())
+
+    # Mark the entry as recently used (see prune_imf_cache):
+    os.utime(entry)
+
+    return time, values, meta
+
+
+def prune_imf_cache(max_bytes, cachedir=None):
+    '''
+    Shrink the IMF cache directory, *cachedir* (defaults to module-level
+    *cache_dir*) to at most *max_bytes* bytes by deleting the least
+    recently used entries first.
+    '''
+
+    import shutil
+
+    if cachedir is None:
+        cachedir = cache_dir
+    if not os.path.isdir(cachedir):
+        return
+
+    # Collect (last use time, size, path) for every entry:
+    entries = []
+    for name in os.listdir(cachedir):
+        path = os.path.join(cachedir, name)
+        if name.startswith('.') or not os.path.isdir(path):
+            continue
+        size = sum(os.path.getsize(os.path.join(path, f))
+                   for f in os.listdir(path))
+        entries.append((os.path.getmtime(path), size, path))
+
+    # Remove oldest entries until we fit:
+    total = sum(e[1] for e in entries)
+    for used, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+def build_imf_index(filename, stride=1000, save=True):
+    '''
+    Build a sparse index of SWMF IMF file *filename*: the byte offset and
+    time of every *stride*-th line of data.  With the index, a range of
+    times can be read by seeking straight to the right part of the file
+    (see ImfData.read_range.)
+
+    The index is returned as a dictionary.  If *save* is **True**, it is
+    also saved next to the data file (see *imf_index_file*) so it only
+    needs to be built once.
+    '''
+
+    # Read the file in binary mode so that positions are true byte counts.
+    with open(filename, 'rb') as f:
+        skip_imf_header(f)
+        pos = f.tell()
+
+        # Every line starts either at the top of the data or right after
+        # a newline character.  Find all newlines a big block at a time,
+        # keeping only every stride-th line start.
+        offsets = [np.array([pos])]
+        nlines = 1
+        while True:
+            buf = f.read(2**24)
+            if not buf:
+                break
+            starts = np.flatnonzero(np.frombuffer(buf, np.uint8) == 10)
+            starts += pos + 1
+            keep = (nlines + np.arange(starts.size)) % stride == 0
+            offsets.append(starts[keep])
+            nlines += starts.size
+            pos += len(buf)
+
+        # Read the time from the start of each indexed line, skipping
+        # blank lines and the end of the file:
+        keep, parts = [], []
+        for off in np.concatenate(offsets):
+            f.seek(off)
+            line = f.readline().split()
+            if len(line) >= 7:
+                keep.append(off)
+                parts.append([int(x) for x in line[:7]])
+
+    # Save file information, too, to tell when the index is out of date:
+    stat = os.stat(filename)
+    index = {'offsets': np.array(keep, dtype=np.int64),
+             'time': build_imf_time(np.array(parts, dtype=np.int64)
+                                    .reshape(-1, 7)),
+             'stride': stride, 'size': stat.st_size,
+             'mtime': stat.st_mtime_ns}
+
+    if save:
+        np.savez(imf_index_file(filename), **index)
+
+    return index
+
+
+def imf_index_file(filename):
+    '''
+    Return the name of the file where the index of IMF file *filename*
+    (see *build_imf_index*) is saved.
+    '''
+    return filename + '.idx.npz'
+
+
+def load_imf_index(filename):
+    '''
+    Load the saved index of IMF file *filename* (see *build_imf_index*.)
+    If there is no index, or the data file has changed since the index was
+    made, **None** is returned.
+    '''
+
+    try:
+        with np.load(imf_index_file(filename)) as npz:
+            index = {k: npz[k] for k in npz.files}
+    except OSError:
+        return None
+
+    # Check that the data file hasn't changed:
+    stat = os.stat(filename)
+    if index['size'] != stat.st_size or index['mtime'] != stat.st_mtime_ns:
+        return None
+
+    return index
+
+
+def split_imf_time(time):
+    '''
+    The reverse of *build_imf_time*: given a *datetime64* array, *time*,
+    return an integer array of shape (nTimes, 7) holding the year, month,
+    day, hour, minute, second, and millisecond of each time.
+    '''
+
+    time = np.asarray(time).astype('datetime64[ms]')
+
+    # Truncating to years, months, and days, then subtracting, gives us
+    # each part of the date:
+    yy = time.astype('datetime64[Y]')
+    mm = time.astype('datetime64[M]')
+    dd = time.astype('datetime64[D]')
+
+    # Milliseconds since the start of each day give the rest:
+    ms = (time - dd).astype(np.int64)
+
+    return np.column_stack([yy.astype(np.int64) + 1970,
+                            (mm - yy).astype(np.int64) + 1,
+                            (dd - mm).astype(np.int64) + 1,
+                            ms // 3600000, ms // 60000 % 60,
+                            ms // 1000 % 60, ms % 1000])
+
+
+def to_timedelta(delta):
+    '''
+    Convert *delta* into a millisecond *timedelta64* value.  *delta* may
+    be a timedelta, a timedelta64, a number of seconds, or a string made
+    of a number and a unit, e.g., '5min', '1h', '30s', '250ms', or '1D'.
+    '''
+
+    import re
+    import datetime as dt
+
+    if isinstance(delta, (np.timedelta64, dt.timedelta)):
+        return np.timedelta64(delta, 'ms')
+
+    if isinstance(delta, str):
+        match = re.fullmatch(r'\s*(\d+)\s*(ms|s|sec|min|h|hr|d|D)\s*', delta)
+        if not match:
+            raise ValueError(f'Cannot understand time interval "{delta}".')
+        units = {'ms': 1, 's': 1000, 'sec': 1000, 'min': 60000,
+                 'h': 3600000, 'hr': 3600000, 'd': 86400000, 'D': 86400000}
+        return np.timedelta64(int(match[1]) * units[match[2]], 'ms')
+
+    # Numbers are seconds:
+    return np.timedelta64(int(round(delta * 1000)), 'ms')
+
+
+def write_imf_header(f, meta=None):
+    '''
+    Write an SWMF IMF header, ending with the "#START" line, to the open
+    file object *f*.  If *meta* (see *parse_imf_header*) holds the original
+    header lines, those are written; otherwise, a simple header with a
+    creation time stamp is made.
+    '''
+
+    import datetime as dt
+
+    if meta and 'header' in meta:
+        lines = meta['header']
+    else:
+        lines = [f'File created on {dt.datetime.now().isoformat()}', '']
+
+    for line in lines:
+        f.write(line + '\n')
+    f.write('#START\n')
+
+
+def write_imf_data(f, time, values, chunk_rows=100000):
+    '''
+    Write the *datetime64* array *time* and *values*, a 2D array or list
+    of arrays with one entry per variable in *imf_vars*, to the open file
+    object *f* as lines of SWMF IMF data.  Values are written with two
+    decimal places, the precision of SWMF IMF files.  Bad values (NaN),
+    which SWMF cannot read, are written as the first of *imf_fill_values*.
+
+    Rather than formatting one line at a time, one format string for a
+    whole chunk of *chunk_rows* lines is filled in a single operation.
+    '''
+
+    # Format of a single line of data:
+    linefmt = '%04d %02d %02d %02d %02d %02d %03d ' + \
+        '%11.2f' * len(imf_vars) + '\n'
+
+    for i in range(0, len(time), chunk_rows):
+        parts = split_imf_time(time[i:i+chunk_rows])
+        n = parts.shape[0]
+
+        # Put integer times and float values side by side, one row per
+        # line of output, then flatten into one long list:
+        table = np.empty((n, 7 + len(imf_vars)), dtype=object)
+        table[:, :7] = parts
+        for j, v in enumerate(values):
+            v = np.asarray(v[i:i+n])
+            table[:, 7+j] = np.where(np.isnan(v), imf_fill_values[0], v)
+        f.write((linefmt * n) % tuple(table.ravel()))
+
+
+def split_imf_file(filename, period, outpattern=None, chunk_rows=100000):
+    '''
+    Split IMF file *filename* into several files, each covering one time
+    window of length *period* (see *to_timedelta*, e.g., '1D' or '6h'.)
+    Windows are aligned to whole multiples of *period*, so daily files
+    start at midnight.  Each new file gets the header of the original.
+
+    The output file names are built from *outpattern*, a format string that
+    is given the start of each window as a datetime, *start*, and the name
+    of the original file without its extension, *base*.  It defaults to
+    '{base}_{start:%Y%m%d_%H%M%S}.dat'.
+
+    The file is read chunk by chunk (see *iter_imf_chunks*), so this works
+    on files of any size.  The list of files written is returned.
+    '''
+
+    if outpattern is None:
+        outpattern = '{base}_{start:%Y%m%d_%H%M%S}.dat'
+    base = os.path.splitext(filename)[0]
+    period = to_timedelta(period).astype(np.int64)
+
+    outnames, out, current = [], None, None
+    try:
+        for chunk in iter_imf_chunks(filename, chunk_rows):
+            # Which window does each line belong to?
+            window = chunk['time'].astype(np.int64) // period
+
+            # Our lines are sorted, so each window is a single run of
+            # lines.  Find where each run starts:
+            starts = np.flatnonzero(np.diff(window)) + 1
+            starts = np.concatenate([[0], starts, [window.size]])
+
+            for i0, i1 in zip(starts[:-1], starts[1:]):
+                # Start a new file if we're in a new window:
+                if window[i0] != current:
+                    if out:
+                        out.close()
+                    current = window[i0]
+                    start = to_datetime(np.datetime64(int(current*period),
+                                                      'ms'))
+                    outnames.append(outpattern.format(base=base, start=start))
+                    out = open(outnames[-1], 'w')
+                    write_imf_header(out, chunk.meta)
+
+                write_imf_data(out, chunk['time'][i0:i1],
+                               chunk.block[:, i0:i1])
+    finally:
+        if out:
+            out.close()
+
+    return outnames
+
+
+def merge_imf_files(filenames, outname, chunk_rows=100000):
+    '''
+    Merge the IMF files in list *filenames* into a single file, *outname*.
+    Files are written in order of their first time, chunk by chunk (see
+    *iter_imf_chunks*), so files of any size can be merged.  The header of
+    the earliest file is used.
+
+    Files should overlap, at most, at their edges.  Lines at or before the
+    last time already written are dropped, so where files overlap, the
+    file that starts earlier wins (the same as ImfData.from_files.)
+    '''
+
+    # Find the first time in each file by reading just its first line:
+    starts = []
+    for name in filenames:
+        chunk = next(iter_imf_chunks(name, chunk_rows=1), None)
+        if chunk is not None:
+            starts.append((chunk['time'][0], len(starts), name))
+
+    # Sort by first time; ties are broken by the order of the list.
+    starts.sort()
+
+    last = None
+    with open(outname, 'w') as out:
+        for i, (t, order, name) in enumerate(starts):
+            for chunk in iter_imf_chunks(name, chunk_rows):
+                if i == 0 and last is None:
+                    write_imf_header(out, chunk.meta)
+
+                # Skip lines we've already covered:
+                keep = slice(None)
+                if last is not None:
+                    keep = slice(np.searchsorted(chunk['time'], last,
+                                                 side='right'), None)
+                time = chunk['time'][keep]
+                if time.size:
+                    write_imf_data(out, time, chunk.block[:, keep])
+                    last = time[-1]
+
+        # A file with no data still needs a header:
+        if last is None and not starts:
+            write_imf_header(out)
+
+
+def align_series(time, values, target, method='nearest', window=None,
+                 max_gap=None):
+    '''
+    Map a time series onto new times.  *time* is a sorted array of
+    *datetime64* values and *values* an array of values at those times (or
+    a 2D array, one row per variable.)  Returns the values at times
+    *target* using one of these methods:
+
+    'nearest': the value at the closest time.
+    'linear': linear interpolation between the times on either side.
+    'window': the mean of all values in the window (t-*window*, t], where
+    *window* is a time span (see *to_timedelta*, e.g., '1h'.)  Bad (NaN)
+    values are skipped.
+
+    Target times outside of *time* give NaN for 'linear'.  With kwarg
+    *max_gap*, 'nearest' gives NaN if the nearest time is further away than
+    *max_gap*, and 'linear' gives NaN if the times on either side are
+    further apart than *max_gap*.
+
+    A binary search ("searchsorted") finds where each target time falls,
+    so the cost grows with the length of the arrays, not their product.
+    '''
+
+    if method not in ('nearest', 'linear', 'window'):
+        raise ValueError(f'Unknown alignment method: {method}')
+
+    time = np.asarray(time).astype('datetime64[ms]').astype(np.int64)
+    target = np.asarray(target).astype('datetime64[ms]').astype(np.int64)
+    values = np.asarray(values)
+    if max_gap is not None:
+        max_gap = to_timedelta(max_gap).astype(np.int64)
+
+    n = time.size
+    shape = values.shape[:-1] + target.shape
+    if n == 0:
+        return np.full(shape, np.nan)
+
+    if method == 'window':
+        if window is None:
+            raise ValueError('Window averages need a window size.')
+        width = to_timedelta(window).astype(np.int64)
+
+        # Points in the window for target t are numbers i0 up to i1-1:
+        i0 = np.searchsorted(time, target - width, side='right')
+        i1 = np.searchsorted(time, target, side='right')
+
+        # Sums over each window are differences of cumulative sums.  Bad
+        # values count as zero and aren't counted.  Removing the mean
+        # first keeps round off small.
+        good = ~np.isnan(values)
+        offset = np.nanmean(values, axis=-1, keepdims=True) if good.any() \
+            else 0
+        zero = np.zeros(values.shape[:-1] + (1,))
+        total = np.concatenate([zero, np.cumsum(np.where(
+            good, values - offset, 0), axis=-1)], axis=-1)
+        count = np.concatenate([zero, np.cumsum(good, axis=-1)], axis=-1)
+
+        npts = count[..., i1] - count[..., i0]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (total[..., i1] - total[..., i0]) / npts + offset
+
+    # Index of the first time after each target (so i-1 is at or before):
+    i = np.clip(np.searchsorted(time, target, side='right'), 1, max(n-1, 1))
+    before = i - 1
+    after = np.minimum(i, n-1)
+    t0, t1 = time[before], time[after]
+
+    if method == 'nearest':
+        pick = np.where(np.abs(target - t0) <= np.abs(t1 - target),
+                        before, after)
+        result = values[..., pick].astype(float)
+        if max_gap is not None:
+            result[..., np.abs(time[pick] - target) > max_gap] = np.nan
+        return result
+
+    # Linear interpolation weights; only one point means no slope.
+    with np.errstate(invalid='ignore', divide='ignore'):
+        frac = np.where(t1 > t0, (target - t0) / (t1 - t0), 0.)
+    result = values[..., before] + frac*(values[..., after] -
+                                         values[..., before])
+    bad = (target < time[0]) | (target > time[-1])
+    if max_gap is not None:
+        bad |= (t1 - t0) > max_gap
+    result[..., bad] = np.nan
+
+    return result
+
+
+def plot_imf(filename, outname=None, style='seaborn-v0_8-dark'):
     '''
     Read and plot imf file *filename* to screen.
     If kwarg *outname* is given, plot is saved to file using *outname* as the
@@ -298,12 +1037,19 @@ def plot_imf(filename, outname=None, style='seaborn-dark'):
     The Matplotlib style sheet can be set with the keyword *style*.
     '''
 
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdt
+
     # Pick style sheet to use:
     plt.style.use(style)
 
     # Load the data as we did last time.
     data = read_imf(filename)
 
+    # Convert our times to Matplotlib's own date numbers just once.  This
+    # saves Matplotlib from converting them again for every line.
+    time = mdt.date2num(data['time'])
+
     # Create a figure object.  This will hold all of our axes objects.
     # Think of this as the paper on which we write.
     # Use *figsize* to set the size in inches (metric is possible, too.)
@@ -329,26 +1075,28 @@ def plot_imf(filename, outname=None, style='seaborn-dark'):
     # Create the IMF By, Bz plot.  Note how we call the object methods
     # that belong to the axes we want to edit.  "label" sets the legend
     # label.  There are MANY kwargs that customize plots!
-    ax1.plot(data['time'], data['by'], 'c--', label='$B_{Y}$')
-    ax1.plot(data['time'], data['bz'], 'b',   label='$B_{Z}$')
+    # Long files have many more points than the screen has pixels, so
+    # DecimatedLine only draws the ones we can see (see above.)
+    DecimatedLine(ax1, time, data['by'], 'c--', label='$B_{Y}$')
+    DecimatedLine(ax1, time, data['bz'], 'b',   label='$B_{Z}$')
 
     # Create a legend!  The legend command is very flexible, check out the
     # docstring to see how it works.
     ax1.legend(loc='upper right', ncol=2)
 
     # Horizontal lines!  Must specify the y, xStart and xEnd.  lw is width.
-    ax1.hlines(0, data['time'][0], data['time'][-1], colors='k',
+    ax1.hlines(0, time[0], time[-1], colors='k',
                linestyles='dashed', lw=2.0)
 
     # Call our format function to cleanup and label our axes.
     format_ax(ax1, 'IMF ($nT$)')
 
     # MIDDLE AXES: NUMBER DENSITY
-    ax2.plot(data['time'], data['rho'], 'r-')
+    DecimatedLine(ax2, time, data['rho'], 'r-')
     format_ax(ax2, r'$\rho$ ($cm^{-3}$)')
 
     # BOTTOM AXES: VELOCITY
-    ax3.plot(data['time'], -1*data['vx'], 'g-')
+    DecimatedLine(ax3, time, -1*data['vx'], 'g-')
     format_ax(ax3, r'$V_{X}$ ($\frac{km}{s}$)')
 
     # Finally, either save or show the plot.
@@ -358,6 +1106,277 @@ def plot_imf(filename, outname=None, style='seaborn-dark'):
         plt.show()
 
 
+def _parse_imf_file(job):
+    '''
+    Open and parse a single IMF file for ImfData.from_files.  *job* is a
+    tuple of (filename, dtype, variables).  This must live at the top of the
+    module so that worker processes can find it.
+    Returns times, values, and header information.
+    '''
+
+    filename, dtype, variables = job
+    with open(filename, 'r') as f:
+        meta = skip_imf_header(f)
+        time, values = parse_imf_data(f, dtype, variables)
+
+    return time, values, meta
+
+
+def _replace_fills(values):
+    '''
+    Return *values* with fill values (see *imf_fill_values*) replaced by
+    NaN.  The data are only copied if there is something to replace.
+    '''
+
+    # Compare every value against the fill values at once.  Fills must be
+    # converted to our type: 9999.99 as a 32-bit float is not the same
+    # number as 9999.99 as a 64-bit float.
+    fills = np.asarray(imf_fill_values, dtype=values.dtype)
+    found = np.isin(values, fills)
+    if found.any():
+        values = np.where(found, np.nan, values)
+
+    return values
+
+
+def _same_array(a, b):
+    '''
+    Return **True** if arrays *a* and *b* are exactly the same values in
+    memory (e.g., two views of the same row), not just equal.
+    '''
+    return (isinstance(a, np.ndarray) and a.shape == b.shape and
+            a.strides == b.strides and a.dtype == b.dtype and
+            a.__array_interface__['data'][0] ==
+            b.__array_interface__['data'][0])
+
+
+def _time_bounds(t0, t1):
+    '''
+    Convert a pair of start and stop times into millisecond datetime64
+    values.  **None** becomes the earliest or latest time possible.
+    '''
+
+    # Use the largest and smallest valid int64 values (excluding NaT)
+    # to represent times with no bound.
+    lo = np.datetime64(np.iinfo(np.int64).min + 1, 'ms')
+    hi = np.datetime64(np.iinfo(np.int64).max, 'ms')
+
+    t0 = lo if t0 is None else np.datetime64(t0, 'ms')
+    t1 = hi if t1 is None else np.datetime64(t1, 'ms')
+
+    return t0, t1
+
+
+def _rolling_extreme(x, starts, better):
+    '''
+    Rolling minimum or maximum (*better* is operator.le for minimum or
+    operator.ge for maximum) of values *x* where the window ending at point
+    i starts at point *starts[i]*.  Bad (NaN) values are skipped; windows
+    with no good values give NaN.
+
+    A "monotonic deque" holds the indexes of points that could still be the
+    extreme value of some window, in order.  Each point is added and removed
+    only once, so the whole calculation is O(n).
+    '''
+    from collections import deque
+
+    out = np.full(x.size, np.nan, dtype=x.dtype)
+    keep = deque()
+
+    # Plain Python lists are much faster than arrays one item at a time,
+    # but take much more memory.  Convert one block at a time so that huge
+    # arrays never become huge lists.  Each block's list starts at the
+    # oldest point still kept, "lo", and indexes count from there.
+    lo = 0
+    for first in range(0, x.size, calc_block_size):
+        last = min(first + calc_block_size, x.size)
+        new_lo = lo + keep[0] if keep else first
+        keep = deque(k + lo - new_lo for k in keep)
+        lo = new_lo
+
+        values = x[lo:last].tolist()
+        begins = (starts[first:last] - lo).tolist()
+        result = [np.nan] * (last - first)
+
+        for j, i in enumerate(range(first - lo, last - lo)):
+            value = values[i]
+            # NaN is never equal to itself; such points never enter the
+            # deque.
+            if value == value:
+                # Points that are no better than the new point can be
+                # forgotten:
+                while keep and better(value, values[keep[-1]]):
+                    keep.pop()
+                keep.append(i)
+            # Points that have left the window are dropped from the front:
+            while keep and keep[0] < begins[j]:
+                keep.popleft()
+            if keep:
+                result[j] = values[keep[0]]
+
+        out[first:last] = result
+
+    return out
+
+
+# Physical constants:
+mu_o = 4*np.pi*1E-7       # Permeability of free space, H/m.
+m_p = 1.67262192E-27      # Proton mass, kg.
+
+
+# The functions below avoid making full-sized temporary arrays.  Writing
+# "bx**2 + by**2" makes a new array for each piece of the expression.
+# Instead, we work on one small block at a time and use the *out* kwarg of
+# Numpy functions to write results straight into arrays we already have.
+# Each function takes an *out* kwarg, too, so callers can re-use their own
+# arrays.  They are used by the ImfData.calc_* methods and by the coupling
+# functions below, so both give exactly the same values.
+def _calc_blocks(like, out):
+    '''
+    Get ready for a block-by-block calculation: return an output array
+    (*out*, if given, or a new empty array the same size and type as array
+    *like*), a scratch array of size *calc_block_size*, and a list of
+    slices that split the data into blocks of that size.
+    '''
+
+    if out is None:
+        out = np.empty_like(like)
+    elif out.shape != like.shape:
+        raise ValueError(f'Output array must have shape {like.shape}.')
+
+    npts = like.size
+    tmp = np.empty(min(npts, calc_block_size), dtype=out.dtype)
+    blocks = [slice(i, i+calc_block_size)
+              for i in range(0, npts, calc_block_size)]
+
+    return out, tmp, blocks
+
+
+def _magnitude(x, y, z, out=None):
+    '''
+    Return the magnitude of the vector with components *x*, *y*, and *z*,
+    written into array *out*, if given.
+    '''
+
+    out, tmp, blocks = _calc_blocks(x, out)
+
+    # Calculate the magnitude block by block:
+    for s in blocks:
+        o, t = out[s], tmp[:out[s].size]
+        np.multiply(x[s], x[s], out=o)
+        np.multiply(y[s], y[s], out=t)
+        np.add(o, t, out=o)
+        np.multiply(z[s], z[s], out=t)
+        np.add(o, t, out=o)
+        np.sqrt(o, out=o)
+
+    return out
+
+
+def _clock(by, bz, out=None):
+    '''
+    Return the IMF clock angle, arctan(By/Bz), written into array *out*,
+    if given.
+    '''
+
+    # A single function call, so no temporary arrays are needed:
+    if out is None:
+        out = np.empty_like(by)
+    return np.arctan2(by, bz, out=out)
+
+
+def _epsilon(v, b, clock, out=None):
+    '''
+    Return Akasofu's epsilon parameter from solar wind speed *v* (km/s),
+    field magnitude *b* (nT), and clock angle *clock*, written into array
+    *out*, if given.
+    '''
+
+    # Calculate conversion factors:
+    conv = 1000. * 1E-9**2 / mu_o  # km/s->m/s; nT**2->T**2
+
+    # Epsilon = conv * v * b**2 * sin(clock/2)**4, block by block:
+    out, tmp, blocks = _calc_blocks(b, out)
+    for s in blocks:
+        o, t = out[s], tmp[:out[s].size]
+        np.multiply(conv, v[s], out=o)
+        np.multiply(b[s], b[s], out=t)
+        np.multiply(o, t, out=o)
+        np.divide(clock[s], 2, out=t)
+        np.sin(t, out=t)
+        np.power(t, 4, out=t)
+        np.multiply(o, t, out=o)
+
+    return out
+
+
+# Solar wind-magnetosphere coupling functions (see ImfData.compute_coupling.)
+# Many of them are built from the same pieces: field and velocity magnitude,
+# powers of the clock angle, and so on.  Each piece is described by a
+# function that is handed the ImfData object and a function, "part", that
+# returns other pieces.  Pieces are only calculated once per call.
+# Units: nT, km/s, and cm^-3 in; see each coupling function for units out.
+
+# Values already stored in the ImfData object (e.g., by calc_b) are used;
+# otherwise they are calculated here without storing them.
+coupling_parts = {
+    'b': lambda imf, part: imf['b'] if 'b' in imf else
+        _magnitude(part('bx'), part('by'), part('bz')),
+    'v': lambda imf, part: imf['v'] if 'v' in imf else
+        _magnitude(part('vx'), part('vy'), part('vz')),
+    'clock': lambda imf, part: imf['clock'] if 'clock' in imf else
+        _clock(part('by'), part('bz')),
+    'bt': lambda imf, part: np.hypot(imf['by'], imf['bz']),
+    'sin_half': lambda imf, part: np.abs(np.sin(part('clock')/2)),
+    'sin_half2': lambda imf, part: part('sin_half')**2,
+    'v2': lambda imf, part: part('v')**2,
+    'sqrt_rho': lambda imf, part: np.sqrt(imf['rho']),
+}
+
+coupling_funcs = {
+    # Akasofu epsilon, the same as ImfData.calc_epsilon:
+    'epsilon': lambda part: _epsilon(part('v'), part('b'), part('clock')),
+    # Newell et al. (2007) dPhi/dt, (km/s)^4/3 nT^2/3:
+    'newell': lambda part: part('v')**(4/3) * part('bt')**(2/3) *
+        part('sin_half')**(8/3),
+    # Borovsky (2008) reconnection rate in its high Mach number limit,
+    # sin^2(theta/2) rho^1/2 v^2 (arbitrary units):
+    'borovsky': lambda part: part('sin_half2') * part('sqrt_rho') *
+        part('v2'),
+    # Dynamic pressure, nPa:
+    'pdyn': lambda part: m_p * 1E6 * 1E6 * 1E9 * part('rho') * part('v2'),
+    # Alfven Mach number, V/V_A:
+    'mach_a': lambda part: part('v') * 1000. * np.sqrt(mu_o * m_p * 1E6) /
+        (part('b') * 1E-9) * part('sqrt_rho'),
+    # Rectified V*Bs, mV/m:
+    'vbs': lambda part: part('v') * np.maximum(-part('bz'), 0) * 1E-3,
+}
+
+# Values read from the file are pieces, too:
+for _name in imf_vars:
+    coupling_parts[_name] = lambda imf, part, _name=_name: imf[_name]
+
+
+def iter_coupling(filename, names=None, chunk_rows=100000):
+    '''
+    Calculate coupling functions (see ImfData.compute_coupling) for IMF file
+    *filename* chunk by chunk (see *iter_imf_chunks*), so files of any size
+    can be handled.  This is a generator that yields, for each chunk, the
+    array of times and a dictionary of coupling function values.
+    '''
+
+    for chunk in iter_imf_chunks(filename, chunk_rows):
+        yield chunk['time'], chunk.compute_coupling(names, store=False)
+
+
+def _coupling_getter(name):
+    '''
+    Make a function that calculates coupling function *name* for an ImfData
+    object.  Used to list coupling functions in ImfData.derived.
+    '''
+    return lambda imf: imf.compute_coupling([name], store=False)[name]
+
+
 # Let's re-do our IMF plotting tool using an object-oriented approach.  We
 # still want the data structure to behave like a dictionary, so we'll
 # inherit from *dict*, Python's dictionary class.
@@ -375,27 +1394,571 @@ class ImfData(dict):
     >>>imf['bx']
     >>>print(imf.keys())
 
+    Information from the file header is found in imf.meta (see
+    *parse_imf_header*), e.g., imf.meta['coor'] for the coordinate system.
+
     This class' parent is **dict**, so it behaves as a specialized
     dictionary.
 
+    Parsing big ascii files takes time.  Set the *cache* kwarg to **True**
+    to save a binary copy of the parsed data in *sciprog.cache_dir* (or set
+    it to the name of another directory to use that instead.)  The next time
+    the same, unchanged file is opened, the binary copy is memory mapped
+    instead of re-parsing the file.  Kwarg *cache_max* sets the maximum size
+    of the cache directory in bytes; least recently used entries are removed
+    to stay under that size.
+
+    Time is stored in imf['time'] as a compact *datetime64* array.  If you
+    need Python datetime objects instead, use imf.datetimes; these are
+    only built the first time they are asked for.
+
+    All of the values read from the file are stored together in a single
+    2D array, imf.block, with one row per variable listed in
+    imf.block_vars.  The dictionary values, e.g., imf['bx'], are views into
+    that block.  Use kwarg *dtype* to set the float type; np.float32 halves
+    the memory used.  Careful: single precision floats hold only about
+    seven digits, so large values lose their last decimal places (e.g., a
+    temperature of 183788.40 becomes 183788.41.)  Files written from
+    np.float32 data are not exact copies of the originals.
+
+    To work with part of a file, use imf.slice(t0, t1) to get a view of
+    the data between two times.  To read just part of a big file, use
+    ImfData.read_range(filename, t0, t1) instead.
+
+    If only some of the values are needed, list them with kwarg
+    *variables*, e.g., ImfData('file.dat', variables=['bz', 'vx']).  Only
+    those columns (plus time) are converted and stored.  With kwarg *lazy*
+    set to **True**, the file isn't opened until the data is first used.
+
+    Derived values, e.g., imf['b'] or imf['epsilon'], are calculated the
+    first time they are asked for and then kept.  If a value they depend on
+    is replaced (e.g., imf['bx'] = new_bx), they are thrown out and will be
+    recalculated when next needed.  If you change values in place instead
+    (e.g., imf['bx'][0] = 3), call imf.invalidate('bx') afterwards.  New
+    derived values can be added with ImfData.register_derived.
+
+    Fill values in the file (see *imf_fill_values*) are replaced with NaN
+    when loaded.  imf.mask is a boolean array, shaped like imf.block, that
+    is **True** for each bad value.  imf.gaps lists the indexes of points
+    that are followed by a gap in time (a step longer than gap_factor
+    times the typical step, imf.cadence.)  Use imf.fill_gaps to fill both.
+
     '''
 
+    # Class-level attributes are shared by all objects until an object sets
+    # its own.  This flag marks objects that still have to read their file.
+    _pending = False
+
+    # Values derived from others.  Each name maps to the names of the values
+    # it depends on and either the name of the method that calculates and
+    # stores it or a function that is given the object and returns it.
+    derived = {'b': (('bx', 'by', 'bz'), 'calc_b'),
+               'v': (('vx', 'vy', 'vz'), 'calc_v'),
+               'clock': (('by', 'bz'), 'calc_clock'),
+               'epsilon': (('b', 'v', 'clock'), 'calc_epsilon'),
+               'newell': (('v', 'clock', 'by', 'bz'),
+                          _coupling_getter('newell')),
+               'borovsky': (('v', 'clock', 'rho'),
+                            _coupling_getter('borovsky')),
+               'pdyn': (('v', 'rho'), _coupling_getter('pdyn')),
+               'mach_a': (('v', 'b', 'rho'), _coupling_getter('mach_a')),
+               'vbs': (('v', 'bz'), _coupling_getter('vbs'))}
+
     # Define the __init__ class, which sets how the object is made:
-    def __init__(self, filename):
+    def __init__(self, filename=None, cache=False, cache_max=None,
+                 dtype=np.float64, variables=None, lazy=False):
         # Call initialization method of parent class.  This causes the
         # object to be built just like a dictionary...
         super(ImfData, self).__init__(self)
 
         # ...but we'll customize how it is made:
-        # Store file name.
+        # Store file name and cache settings.
         self.file = filename
-
-        # Load the data into self:
-        self._read_data()
+        self.cache = cache
+        self.cache_max = cache_max
+        self.dtype = np.dtype(dtype)
+        self._block, self.block_vars = None, []
+        self._own_block = False
+        self._mask, self._gaps, self._cadence = None, None, None
+        self._meta = {}
+
+        # Check our list of variables now, before any reading is done:
+        self.variables = list(imf_vars if variables is None else variables)
+        for v in self.variables:
+            if v not in imf_vars:
+                raise ValueError(f'Unknown IMF variable: {v}')
+
+        # Load the data into self.  With no file, we're an empty container
+        # that can be filled by hand (see *from_arrays*.)  In lazy mode,
+        # we wait until somebody asks for the data.
+        self._pending = filename is not None
+        if self._pending and not lazy:
+            self._load()
 
         # Good to return "None".
         return None
 
+    # A "class method" is called from the class itself rather than from an
+    # object, e.g., ImfData.from_arrays(...).  Its first argument is the
+    # class, which lets us build new objects in different ways.
+    @classmethod
+    def from_arrays(cls, time, values, filename=None, variables=None,
+                    meta=None):
+        '''
+        Create a new ImfData object from a *datetime64* array of times,
+        *time*, and a 2D array of *values* with one row per variable in
+        *variables* (defaults to *imf_vars*.)  No file is read; *filename*
+        is only used as a label.  Header information can be given as a
+        dictionary with kwarg *meta* (see *parse_imf_header*.)
+        '''
+
+        imf = cls(dtype=values.dtype, variables=variables)
+        imf.file = filename
+        if meta is not None:
+            imf.meta = meta
+        imf._set_block(time, values, imf.variables)
+
+        return imf
+
+    @classmethod
+    def read_range(cls, filename, t0=None, t1=None, index=None,
+                   dtype=np.float64, variables=None):
+        '''
+        Read only the data between times *t0* and *t1* (inclusive) from
+        file *filename*.  Times may be datetimes, datetime64 values, or
+        ISO-formatted strings; **None** means the start or end of the file.
+        Kwargs *dtype* and *variables* work as in ImfData.  Caching and lazy
+        reading are not available for part of a file.
+
+        A sparse index of the file is used to skip straight to the right
+        lines (see *build_imf_index*.)  Give it with kwarg *index*;
+        otherwise, the saved index is used, or a new one is built and saved.
+        '''
+
+        # Get our index:
+        if index is None:
+            index = load_imf_index(filename)
+        if index is None:
+            try:
+                index = build_imf_index(filename)
+            except OSError:
+                # Can't save next to the file?  Use it without saving.
+                index = build_imf_index(filename, save=False)
+
+        t0, t1 = _time_bounds(t0, t1)
+
+        # Find the indexed lines on either side of our time range.  Every
+        # line before index entry k0 is before t0; every line from entry
+        # k1 onwards is after t1.
+        itime, offsets = index['time'], index['offsets']
+        k0 = max(np.searchsorted(itime, t0, side='left') - 1, 0)
+        k1 = np.searchsorted(itime, t1, side='right')
+
+        # Read the header, then just the bytes we need:
+        with open(filename, 'rb') as f:
+            meta = skip_imf_header(f)
+            if offsets.size:
+                f.seek(offsets[k0])
+            if k1 < offsets.size:
+                text = f.read(offsets[k1] - f.tell())
+            else:
+                text = f.read()
+
+        # Build our object, then trim to the exact time range:
+        imf = cls(dtype=dtype, variables=variables)
+        imf.file, imf.meta = filename, meta
+        time, values = parse_imf_data(text.decode().splitlines(), imf.dtype,
+                                      imf.variables)
+        i0 = np.searchsorted(time, t0, side='left')
+        i1 = np.searchsorted(time, t1, side='right')
+        imf._set_block(time[i0:i1], values[:, i0:i1], imf.variables,
+                       own=True)
+
+        return imf
+
+    @classmethod
+    def from_files(cls, filenames, workers=None, dtype=np.float64,
+                   variables=None):
+        '''
+        Read a list of IMF files, *filenames*, and merge them into a single,
+        time-sorted ImfData object.  Files are parsed in parallel using a
+        pool of *workers* processes (defaults to the number of CPUs; use 1
+        to read them one after another in this process.)  Kwargs *dtype*
+        and *variables* work as in ImfData; the merged data are neither
+        cached nor read lazily.
+
+        Where files overlap, each timestamp is kept once.  The record from
+        the file that starts earlier wins; if two files start at the same
+        time, the one listed first wins.  Header information (self.meta)
+        is taken from the earliest file.
+        '''
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        imf = cls(dtype=dtype, variables=variables)
+        imf.file = list(filenames)
+        jobs = [(f, imf.dtype, imf.variables) for f in imf.file]
+
+        # Parse each file in its own process.  "map" returns results in the
+        # same order as the list of files.
+        if workers == 1 or len(jobs) < 2:
+            parsed = [_parse_imf_file(job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                parsed = list(pool.map(_parse_imf_file, jobs))
+
+        # Put the files in order of their first time.  Python's sort is
+        # stable, so ties keep the order of the input list.
+        parsed = [p for p in parsed if p[0].size]
+        parsed.sort(key=lambda p: p[0][0])
+
+        # Header information comes from the first file:
+        if parsed:
+            imf.meta = parsed[0][2]
+
+        # Create our output arrays once, then fill them file by file:
+        npts = sum(p[0].size for p in parsed)
+        time = np.empty(npts, dtype='datetime64[ms]')
+        values = np.empty((len(imf.variables), npts), dtype=imf.dtype)
+        i = 0
+        for t, v, _ in parsed:
+            time[i:i+t.size], values[:, i:i+t.size] = t, v
+            i += t.size
+
+        # If files overlap, sort them together.  A "stable" sort keeps equal
+        # times in file order, so the first one seen is the one we keep.
+        if npts and (np.diff(time) < np.timedelta64(0)).any():
+            order = np.argsort(time, kind='stable')
+            time, values = time[order], values[:, order]
+
+        # Remove repeated times:
+        keep = np.ones(npts, dtype=bool)
+        keep[1:] = time[1:] != time[:-1]
+        if not keep.all():
+            time, values = time[keep], values[:, keep]
+
+        imf._set_block(time, values, imf.variables, own=True)
+
+        return imf
+
+    def slice(self, t0=None, t1=None):
+        '''
+        Return a new ImfData object holding only the data between times
+        *t0* and *t1* (inclusive.)  Times may be datetimes, datetime64
+        values, or ISO-formatted strings; **None** means the start or end
+        of the data.
+
+        No data is copied: the new object's arrays are views into this
+        object's arrays, so changing one changes the other.
+        '''
+
+        t0, t1 = _time_bounds(t0, t1)
+
+        # Our times are sorted, so a binary search finds the range:
+        time = self['time']
+        i0 = np.searchsorted(time, t0, side='left')
+        i1 = np.searchsorted(time, t1, side='right')
+
+        # Build the new object from views of our block...
+        new = self.__class__(dtype=self.dtype, variables=self.variables)
+        new.file, new.meta = self.file, self.meta
+        mask = None if self._mask is None else self._mask[:, i0:i1]
+        new._set_block(time[i0:i1], self.block[:, i0:i1], self.block_vars,
+                       mask, fills=False)
+
+        # ...and of any other values, e.g., those from calc_* methods:
+        for k, v in self.items():
+            if k not in new:
+                new[k] = v[i0:i1]
+
+        return new
+
+    def _set_block(self, time, values, names, mask=None, fills=True,
+                   own=False):
+        '''
+        Store *time* and the 2D array of *values*, whose rows are the
+        variables listed in *names*, in self.  Each requested variable (see
+        self.variables) becomes a dictionary entry that is a view into the
+        block.
+
+        Fill values (see *imf_fill_values*) are replaced by NaN.  Set
+        *fills* to **False** to skip this search if the values are known to
+        hold none (e.g., values from the cache.)  The bad value mask and
+        time gaps (see self.mask, self.gaps) are only found when first
+        asked for, unless the *mask* is already known and handed over.
+
+        Set *own* to **True** if nobody else has the *values* array.
+        Otherwise (e.g., the arrays handed to *from_arrays* or the block of
+        the parent of a *slice*), the block is copied before it is changed
+        (see *__setitem__*.)
+        '''
+
+        if fills:
+            found = _replace_fills(values)
+            own = own or found is not values
+            values = found
+
+        self._block, self.block_vars = values, list(names)
+        self._own_block = own
+        self._mask, self._gaps, self._cadence = mask, None, None
+        self['time'] = time
+        for k in self.variables:
+            self[k] = values[self.block_vars.index(k)]
+
+    def _find_gaps(self):
+        '''
+        Find missing times: steps much longer than the typical step.  Sets
+        self.cadence and self.gaps.
+        '''
+
+        time = self['time']
+        step = np.diff(time)
+        if step.size:
+            cadence = np.median(step.astype(np.int64))
+            self._cadence = np.timedelta64(int(cadence), 'ms')
+            self._gaps = np.flatnonzero(step > gap_factor * self._cadence)
+        else:
+            self._cadence, self._gaps = None, np.array([], dtype=np.intp)
+
+    @property
+    def block(self):
+        '''
+        The 2D array holding all values read from the file, one row per
+        variable in self.block_vars.
+        '''
+        self._load()
+        return self._block
+
+    # Like the block, these attributes are only ready once the file has
+    # been read, so reading them in lazy mode reads the file first.  The
+    # mask, gaps, and cadence each take a pass over all of the data, so
+    # they are only found the first time they are asked for.
+    @property
+    def meta(self):
+        '''Information from the file header (see *parse_imf_header*.)'''
+        self._load()
+        return self._meta
+
+    @meta.setter
+    def meta(self, value):
+        self._meta = value
+
+    @property
+    def mask(self):
+        '''Boolean array, shaped like self.block, marking bad values.'''
+        self._load()
+        if self._mask is None:
+            # Fill values are already NaN, so bad values are NaN values:
+            self._mask = np.isnan(self._block)
+        return self._mask
+
+    @property
+    def gaps(self):
+        '''Indexes of points that are followed by a gap in time.'''
+        self._load()
+        if self._gaps is None:
+            self._find_gaps()
+        return self._gaps
+
+    @property
+    def cadence(self):
+        '''The typical time step, as a *timedelta64*.'''
+        self._load()
+        if self._gaps is None:
+            self._find_gaps()
+        return self._cadence
+
+    def _load(self):
+        '''
+        Read our file if we haven't done so yet.
+        '''
+
+        # Switch off the flag first: reading the file sets values, which
+        # would otherwise bring us right back here.
+        if self._pending:
+            self._pending = False
+            self._read_data()
+
+    # In lazy mode, the file must be read before any dictionary method
+    # touches our values.  Wrap the most common ones so that they do:
+    # Getting a missing derived value calculates it first.  Setting a value
+    # throws out everything derived from it.
+    def __getitem__(self, key):
+        self._load()
+        if not super(ImfData, self).__contains__(key) and key in self.derived:
+            self._calc(key)
+        return super(ImfData, self).__getitem__(key)
+
+    def __setitem__(self, key, value):
+        self._load()
+
+        # Values read from the file live in rows of our block, which
+        # *slice*, *resample*, and others work from.  New values for those
+        # are copied into the block so that everything sees them.  Values
+        # that don't fit in a row (e.g., a different number of points)
+        # simply replace the old ones, as in any dictionary.
+        if self._block is not None and key in self.block_vars:
+            i = self.block_vars.index(key)
+            shape = np.shape(value)
+            if not _same_array(value, self._block[i]) and \
+               shape in ((), self._block[i].shape):
+                # "Copy on write": never change a block others can see.
+                if not self._own_block:
+                    self._copy_block()
+                self._block[i] = value
+                if self._mask is not None:
+                    self._mask[i] = np.isnan(self._block[i])
+                value = self._block[i]
+
+        super(ImfData, self).__setitem__(key, value)
+        self.invalidate(key)
+
+        # Gaps and cadence come from the times; find them again if needed:
+        if key == 'time':
+            self._gaps, self._cadence = None, None
+
+    def _copy_block(self):
+        '''
+        Replace our block (and mask) with a copy of our own, pointing our
+        dictionary values at the new rows.
+        '''
+
+        old, self._block = self._block, self._block.copy()
+        if self._mask is not None:
+            self._mask = self._mask.copy()
+        for i, k in enumerate(self.block_vars):
+            if super(ImfData, self).__contains__(k) and \
+               _same_array(super(ImfData, self).__getitem__(k), old[i]):
+                super(ImfData, self).__setitem__(k, self._block[i])
+        self._own_block = True
+
+    def __contains__(self, key):
+        self._load()
+        return super(ImfData, self).__contains__(key)
+
+    def __iter__(self):
+        self._load()
+        return super(ImfData, self).__iter__()
+
+    def __len__(self):
+        self._load()
+        return super(ImfData, self).__len__()
+
+    def keys(self):
+        self._load()
+        return super(ImfData, self).keys()
+
+    def values(self):
+        self._load()
+        return super(ImfData, self).values()
+
+    def items(self):
+        self._load()
+        return super(ImfData, self).items()
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    @classmethod
+    def register_derived(cls, name, depends, func):
+        '''
+        Add a new derived value, *name*, to this class.  *depends* is a list
+        of the values it is calculated from and *func* is a function that is
+        given an ImfData object and returns the new value, e.g.,
+
+        >>>ImfData.register_derived('bt', ['by', 'bz'],
+        >>>                         lambda imf: np.hypot(imf['by'], imf['bz']))
+        >>>imf['bt']
+        '''
+
+        # Give this class its own copy of the table so that adding values to
+        # a subclass doesn't change its parent:
+        if 'derived' not in cls.__dict__:
+            cls.derived = dict(cls.derived)
+        cls.derived[name] = (tuple(depends), func)
+
+    def _calc(self, key):
+        '''
+        Calculate and store the derived value *key*.
+        '''
+        func = self.derived[key][1]
+        if isinstance(func, str):
+            getattr(self, func)()
+        else:
+            self[key] = func(self)
+
+    def invalidate(self, *keys):
+        '''
+        Throw out every stored derived value that depends, directly or
+        indirectly, on any of *keys*.  They are recalculated when needed.
+        Call this after changing values in place, e.g.,
+
+        >>>imf['bx'][0] = 3
+        >>>imf.invalidate('bx')
+        '''
+
+        # Walk through the table of derived values until nothing new turns
+        # up.  Each pass finds values that depend on ones we've already
+        # found.
+        stale, changed = set(keys), True
+        while changed:
+            changed = False
+            for name, (depends, func) in self.derived.items():
+                if name not in stale and stale.intersection(depends):
+                    stale.add(name)
+                    changed = True
+
+        for name in stale.difference(keys):
+            super(ImfData, self).pop(name, None)
+
+    def __reduce__(self):
+        '''
+        Tell the "pickle" module how to save this object.  The block of
+        values is saved once, as a single buffer, rather than as a separate
+        copy for each view into it.
+        '''
+
+        # Anything that isn't a view of our block (e.g., calc_* results or
+        # columns replaced by the user) is saved separately:
+        extras = {}
+        for k, v in self.items():
+            if k == 'time':
+                continue
+            if k in self.block_vars and \
+               _same_array(v, self.block[self.block_vars.index(k)]):
+                continue
+            extras[k] = v
+
+        # Save our attributes, except for cached datetimes and the block,
+        # which is already handled:
+        state = {k: v for k, v in self.__dict__.items()
+                 if not k.startswith('_dtime')
+                 and k not in ('_block', '_own_block')}
+
+        # See the pickle documentation for what these items are:
+        # https://docs.python.org/3/library/pickle.html#object.__reduce__
+        return (self.__class__._unpickle,
+                (np.asarray(self['time']), np.asarray(self.block), self.file,
+                 self.block_vars, self.variables), state, None,
+                iter(extras.items()))
+
+    @classmethod
+    def _unpickle(cls, time, values, filename, names, variables):
+        '''
+        Rebuild a pickled object (see *__reduce__*.)  The rows of the block,
+        *names*, may hold more than the requested *variables* (e.g., when
+        loaded from the cache), so only those become dictionary entries.
+        '''
+
+        imf = cls(dtype=values.dtype, variables=variables)
+        imf.file = filename
+        imf._set_block(time, values, names, fills=False, own=True)
+
+        return imf
+
     def __str__(self):
         '''
         Set the string representation of the object, i.e., what is displayed
@@ -411,55 +1974,380 @@ class ImfData(dict):
         '''
         return self.__str__()
 
-    def calc_b(self):
+    @property
+    def datetimes(self):
+        '''
+        The values of self['time'] as an array of Python datetime objects.
+        The conversion is performed on first access and cached until
+        self['time'] is replaced.
+        '''
+
+        # "getattr" with a default lets us check for our cache even if it
+        # hasn't been created yet:
+        if getattr(self, '_dtime_src', None) is not self['time']:
+            self._dtime = to_datetime(self['time'])
+            self._dtime_src = self['time']
+
+        return self._dtime
+
+    # The calc_* methods do their work with the module-level functions
+    # *_magnitude* and *_epsilon* (which compute_coupling uses, too), then
+    # store the results.
+
+    def calc_b(self, out=None):
         '''
         Calculate the magnitude of the magnetic field.  Store as self['b'].
+        The result is written into array *out*, if given.
         '''
-        # Import numpy's square root function.
-        from numpy import sqrt
-        # Calculate and store the total field magnitude.
-        self['b'] = sqrt(self['bx']**2 + self['by']**2 + self['bz']**2)
+        self['b'] = _magnitude(self['bx'], self['by'], self['bz'], out)
 
-    def calc_v(self):
+    def calc_v(self, out=None):
         '''
         Calculate the magnitude of the velocity vector.  Store as self['v'].
+        The result is written into array *out*, if given.
         '''
-        # Import numpy's square root function.
-        from numpy import sqrt
-        # Calculate and store the total field magnitude.
-        self['v'] = sqrt(self['vx']**2 + self['vy']**2 + self['vz']**2)
+        self['v'] = _magnitude(self['vx'], self['vy'], self['vz'], out)
 
-    def calc_clock(self):
+    def calc_clock(self, out=None):
         '''
         Calculate IMF clock angle, arctan(By/Bz).
         Theta=0 is purely northward IMF, 180 is southward.
+        The result is written into array *out*, if given.
         '''
-        self['clock'] = np.arctan2(self['by'], self['bz'])
+        self['clock'] = _clock(self['by'], self['bz'], out)
 
-    def calc_epsilon(self):
+    def calc_epsilon(self, out=None):
         '''
         Calculate the epsilon parameter representing the power input into
-        the magnetosphere.
+        the magnetosphere.  The result is written into array *out*, if
+        given.
         '''
-        # Ensure prequisite variables are calculated.
-        # The "if 'blah' in self" is possible because self is subclassed
-        # from dictionaries!  We're testing to see if 'blah' is a key to
-        # the dictionary "self".
-        if 'b' not in self:
-            self.calc_b()
-        if 'v' not in self:
-            self.calc_v()
-        if 'clock' not in self:
-            self.calc_clock()
+        # There is no need to check for prequisite variables: asking for
+        # self['b'] calculates it if it isn't there yet (see self.derived.)
+        self['epsilon'] = _epsilon(self['v'], self['b'], self['clock'], out)
 
-        # Calculate mu-naught
-        mu_o = 4*np.pi*1E-7
+    def resample(self, cadence, how='mean'):
+        '''
+        Average (or otherwise combine) the data into regular time bins of
+        length *cadence* (see *to_timedelta*, e.g., '5min', '1h', or '1D'.)
+        Bins are aligned to whole multiples of *cadence*, so hourly bins
+        start on the hour.  A new ImfData object is returned; its times are
+        the start of each bin.
+
+        Kwarg *how* sets how values in each bin are combined: 'mean',
+        'median', 'min', 'max', or 'count' (the number of points in each
+        bin.)  Bad values (see self.mask) are skipped.  Bins with no data,
+        e.g., in data gaps, are set to NaN (or 0 for 'count'.)
+
+        Only the values read from the file are resampled.  Derived values,
+        e.g., 'epsilon', are calculated from the resampled values when asked
+        for.
+        '''
 
-        # Calculate conversion factors:
-        conv = 1000. * 1E-9**2 / mu_o  # km/s->m/s; nT**2->T**2
+        if how not in ('mean', 'median', 'min', 'max', 'count'):
+            raise ValueError(f'Unknown resampling method: {how}')
+
+        cad = to_timedelta(cadence).astype(np.int64)
+        if cad <= 0:
+            raise ValueError('Cadence must be positive.')
+
+        # Lazy objects need their block before we can find rows in it:
+        self._load()
+        rows = [self.block_vars.index(v) for v in self.variables]
+        time, values = self['time'], self.block[rows]
+        if time.size == 0:
+            return self.from_arrays(time, values, self.file, self.variables,
+                                    self.meta)
+
+        # Our method needs sorted times:
+        if (np.diff(time) < np.timedelta64(0)).any():
+            order = np.argsort(time, kind='stable')
+            time, values = time[order], values[:, order]
+
+        # Find the bin number of each point, counting from the first bin:
+        ibin = time.astype(np.int64) // cad
+        first = ibin[0]
+        ibin = ibin - first
+        nbins = ibin[-1] + 1
+
+        # Points in the same bin are next to each other.  Find the start of
+        # each run of points ("reduceat" combines values between these
+        # starting points) and how many points are in each bin:
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(ibin)) + 1])
+        full = ibin[starts]
+
+        # Bad values (NaN, see self.mask) are left out, so count the good
+        # values of each variable in each bin:
+        good = ~np.isnan(values)
+        count = np.add.reduceat(good, starts, axis=1)
+
+        # Bins with no good values give NaN; don't warn about it.
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if how == 'mean':
+                result = np.add.reduceat(np.where(good, values, 0), starts,
+                                         axis=1) / count
+            elif how == 'min':
+                # "fmin" and "fmax" skip over NaNs:
+                result = np.fmin.reduceat(values, starts, axis=1)
+            elif how == 'max':
+                result = np.fmax.reduceat(values, starts, axis=1)
+            elif how == 'count':
+                result = count
+            else:
+                # Sort values within each bin (NaNs go last), then average
+                # the middle one (odd counts) or two (even counts) of each
+                # bin:
+                result = np.empty((len(rows), full.size))
+                for i, v in enumerate(values):
+                    n = count[i]
+                    lo, hi = starts + (n-1)//2, starts + n//2
+                    ordered = v[np.lexsort((v, ibin))]
+                    result[i] = np.where(n > 0, (ordered[lo]+ordered[hi])/2,
+                                         np.nan)
+
+        # Place results into a grid with every bin, empty or not:
+        out = np.full((len(rows), nbins), 0 if how == 'count' else np.nan,
+                      dtype=self.dtype)
+        out[:, full] = result
+
+        newtime = ((first + np.arange(nbins)) * cad).astype('datetime64[ms]')
+
+        return self.from_arrays(newtime, out, self.file, self.variables,
+                                self.meta)
+
+    def rolling(self, var, window, stat='mean'):
+        '''
+        Calculate a statistic of value *var* (any key, including derived
+        values such as 'epsilon') over a trailing time *window* (see
+        *to_timedelta*, e.g., '1h'.)  The window for each point covers the
+        times (t-window, t], so irregular time spacing and data gaps are
+        respected.  Returns an array the same size as *var*.
+
+        Kwarg *stat* can be 'mean', 'std', 'sum', 'count', 'min', 'max', or
+        'integral' (trapezoidal integral over time in seconds between the
+        first point in the window and the current point.)  Bad values (NaN,
+        see self.mask) are skipped: 'count' is the number of good values,
+        and windows with none give NaN (0 for 'sum'.)
+
+        Sums are calculated from cumulative sums and min/max with a
+        monotonic deque, so the cost grows only linearly with the number
+        of points, no matter how wide the window is.
+        '''
+
+        if stat not in ('mean', 'std', 'sum', 'count', 'min', 'max',
+                        'integral'):
+            raise ValueError(f'Unknown rolling statistic: {stat}')
+
+        time, x = self['time'], np.asarray(self[var])
+        w = to_timedelta(window)
+
+        # Window for point i covers points starts[i] through i:
+        starts = np.searchsorted(time, time - w, side='right')
+        ends = np.arange(1, time.size+1)
+
+        if stat == 'min':
+            return _rolling_extreme(x, starts, operator.le)
+        if stat == 'max':
+            return _rolling_extreme(x, starts, operator.ge)
+
+        def window_sum(y):
+            # Sum over each window as a difference of cumulative sums:
+            total = np.concatenate([[0], np.cumsum(y, dtype=np.float64)])
+            return total[ends] - total[starts]
+
+        # Bad (NaN) values are left out: "count" is the number of good
+        # points in each window, and sums only include good points.
+        good = ~np.isnan(x)
+        ngood = np.concatenate([[0], np.cumsum(good)])
+        count = ngood[ends] - ngood[starts]
+
+        if stat == 'count':
+            return count
+
+        if stat == 'integral':
+            # Cumulative trapezoidal integral over the good points only, so
+            # bad points are bridged by their good neighbors:
+            secs = (time[good] - time[0]) / np.timedelta64(1, 's')
+            xgood = x[good]
+            area = np.concatenate([[0], np.cumsum(np.diff(secs)
+                                              * (xgood[1:] + xgood[:-1]) / 2)])
+            # First and last good point in each window, counted in "area":
+            first, last = ngood[starts], ngood[ends] - 1
+            result = area[np.maximum(last, 0)] - area[np.minimum(first,
+                                                                 area.size-1)]
+            return np.where(count > 0, result, np.nan)
+
+        # Remove the overall mean first: this keeps the cumulative sums
+        # small, limiting round-off errors over long records.
+        offset = x[good].mean() if good.any() else 0
+        dev = np.where(good, x - offset, 0)
+        total = window_sum(dev)
+        if stat == 'sum':
+            return total + offset * count
+
+        # Windows without good points give NaN:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / count
+            if stat == 'mean':
+                return mean + offset
+
+            # Standard deviation from the mean of squares minus the square
+            # of the mean; round-off can make this slightly negative.
+            variance = window_sum(dev**2) / count - mean**2
+        return np.sqrt(np.clip(variance, 0, None))
+
+    def fill_gaps(self, method='linear', max_gap=None):
+        '''
+        Return a new ImfData object with data gaps filled.  Missing times
+        (see self.gaps) are filled in at the typical time step,
+        self.cadence, and bad values (see self.mask) and the values at the
+        new times are replaced using *method*:
+
+        'linear': linear interpolation between good values.
+        'hold': the last good value is repeated.
+        'nan': values are set to NaN.
+
+        Gaps longer than *max_gap* (see *to_timedelta*, e.g., '10min') are
+        left as NaN.  Each variable is filled in a single pass over the data.
+        '''
+
+        if method not in ('linear', 'hold', 'nan'):
+            raise ValueError(f'Unknown gap filling method: {method}')
+
+        # Lazy objects need their block, gaps, and cadence first:
+        self._load()
+        rows = [self.block_vars.index(v) for v in self.variables]
+        time, values = self['time'], self.block[rows]
+
+        # Find how many points are missing in each gap, then insert them
+        # all at once.  "repeat" gives each new point the index of the
+        # point before its gap...
+        if self.gaps is not None and self.gaps.size:
+            step = self.cadence.astype(np.int64)
+            width = (time[self.gaps+1] - time[self.gaps]).astype(np.int64)
+            nmiss = np.round(width/step).astype(np.int64) - 1
+            before = np.repeat(self.gaps, nmiss)
+            # ...and "k", counting 1, 2, ... within each gap, sets its time:
+            k = np.arange(before.size) - np.repeat(np.cumsum(nmiss) - nmiss,
+                                                   nmiss) + 1
+            newtime = time[before] + k * self.cadence
+
+            # Sort the new points in after the points before their gaps:
+            where = np.concatenate([np.arange(time.size), before])
+            order = np.argsort(where, kind='stable')
+            time = np.concatenate([time, newtime])[order]
+            values = np.concatenate([values, np.full((len(rows), before.size),
+                                                     np.nan, values.dtype)],
+                                    axis=1)[:, order]
+        else:
+            values = values.copy()
+
+        if max_gap is not None:
+            max_gap = to_timedelta(max_gap)
+
+        index = np.arange(time.size)
+        for x in values:
+            good = ~np.isnan(x)
+            if method == 'nan' or good.all() or not good.any():
+                continue
+
+            # Index of the last good value at or before each point and of
+            # the next one at or after:
+            prev = np.maximum.accumulate(np.where(good, index, -1))
+            nxt = np.minimum.accumulate(np.where(good, index, time.size)
+                                        [::-1])[::-1]
+            bad = ~good & (prev >= 0)
+            if method == 'linear':
+                bad &= nxt < time.size
+
+            if max_gap is not None:
+                # Time between the good values on either side of each point
+                # (or since the last good value, at the end of the data):
+                end = np.where(nxt < time.size,
+                               time[np.minimum(nxt, time.size-1)], time)
+                bad &= (end - time[np.maximum(prev, 0)]) <= max_gap
+
+            if method == 'hold':
+                x[bad] = x[prev[bad]]
+            else:
+                tsec = time.astype(np.int64)
+                x[bad] = np.interp(tsec[bad], tsec[good], x[good])
+
+        return self.from_arrays(time, values, self.file, self.variables,
+                                self.meta)
+
+    def align(self, target, variables=None, method='nearest', window=None,
+              max_gap=None):
+        '''
+        Map values onto other times, *target*: an array of *datetime64*
+        values or an object with a 'time' entry, e.g., a DstData object.
+        Kwarg *variables* lists the values to map (defaults to
+        self.variables; derived values such as 'epsilon' work too.)  See
+        *align_series* for the methods and other kwargs.
+
+        Returns a dictionary with the target 'time' and each variable, e.g.,
+        minute IMF averaged over each hour of Dst:
+
+        >>> hourly = imf.align(dst, ['bz', 'epsilon'], 'window', '1h')
+        '''
 
-        self['epsilon'] = conv*self['v'] * self['b']**2 \
-            * np.sin(self['clock']/2)**4
+        if hasattr(target, 'keys'):
+            target = target['time']
+        names = self.variables if variables is None else list(variables)
+
+        # All variables are mapped together in one call:
+        values = np.vstack([self[k] for k in names])
+        result = align_series(self['time'], values, target, method, window,
+                              max_gap)
+
+        aligned = {'time': np.asarray(target)}
+        for k, v in zip(names, result):
+            aligned[k] = v
+
+        return aligned
+
+    def compute_coupling(self, names=None, store=True):
+        '''
+        Calculate any number of solar wind-magnetosphere coupling functions
+        at once.  *names* is a list of names from *coupling_funcs* (all of
+        them by default):
+
+        epsilon  -- Akasofu's epsilon parameter (see calc_epsilon.)
+        newell   -- Newell et al. (2007) dPhi/dt, (km/s)^4/3 nT^2/3.
+        borovsky -- Borovsky (2008) reconnection rate, high Mach number
+                    limit, arbitrary units.
+        pdyn     -- Solar wind dynamic pressure, nPa.
+        mach_a   -- Alfven Mach number.
+        vbs      -- Rectified V*Bs, mV/m.
+
+        Pieces shared between functions, e.g., |B|, |V|, and powers of
+        sin(theta/2), are only calculated once.  A dictionary of results is
+        returned; unless *store* is **False**, results are also stored in
+        self under the same names.  With *store* set to **False**, nothing
+        at all is stored in self, not even pieces such as |B|.
+        '''
+
+        if names is None:
+            names = list(coupling_funcs)
+        for name in names:
+            if name not in coupling_funcs:
+                raise ValueError(f'Unknown coupling function: {name}')
+
+        # Each piece is calculated the first time it is asked for, then
+        # saved in "parts" for the next function that needs it:
+        parts = {}
+        def part(key):
+            if key not in parts:
+                parts[key] = coupling_parts[key](self, part)
+            return parts[key]
+
+        results = {name: coupling_funcs[name](part) for name in names}
+
+        if store:
+            for name, value in results.items():
+                self[name] = value
+
+        return results
 
     def _read_data(self):
         '''
@@ -471,47 +2359,61 @@ class ImfData(dict):
         # Note, however, that our data container is now self and not a
         # dictionary that is returned!
 
-        import numpy as np
-        import datetime as dt
-
         # Check our arguments, raise exceptions if something is wrong.
         if not isinstance(self.file, str):
             raise TypeError('Input file name must be a string.')
 
-        # Open the file using a "with" block of code. The file is
-        # autmatically closed when this block is exited.
-        with open(self.file, 'r') as f:
-            # Read the very first line.
-            line = f.readline()
+        # Find our cache entry, if caching is turned on:
+        entry = None
+        if self.cache:
+            cachedir = None if self.cache is True else self.cache
+            entry = imf_cache_entry(self.file, cachedir, self.dtype)
 
-            # Skip ahead to end of header.
-            while line.strip() != '#START':
-                line = f.readline()
+        # Cache entries always hold every variable.  Memory mapping means
+        # that the rows we don't use are never read from disk.
+        names = imf_vars if entry else self.variables
 
-            # Slurp remainder of file.
-            lines = f.readlines()
-
-        # How many lines do we have?  The "len()" function will tell us!
-        nLines = len(lines)
-
-        # Define variable names:
-        keys = ['bx', 'by', 'bz', 'vx', 'vy', 'vz', 'rho', 'temp']
-        self['time'] = np.zeros(nLines, dtype='object')
-        for k in keys:
-            self[k] = np.zeros(nLines)  # a vector of floats!
-
-        # Parse remainder of file:
-        for i, l in enumerate(lines):
-            # Split up the line into parts:
-            parts = l.split()
+        if entry and os.path.isdir(entry):
+            # Use the binary copy of this file:
+            time, values, self.meta = load_imf_cache(entry)
+        else:
+            # Open the file using a "with" block of code. The file is
+            # autmatically closed when this block is exited.
+            with open(self.file, 'r') as f:
+                # Skip ahead to end of header, saving header info.
+                self.meta = skip_imf_header(f)
+
+                # Parse remainder of file in one go:
+                time, values = parse_imf_data(f, self.dtype, names)
+
+            # Save a binary copy for next time.  Fill values are replaced
+            # first, so that reopening the cache never has to look at
+            # every value again.
+            values = _replace_fills(values)
+            if entry:
+                save_imf_cache(entry, time, values, self.cache_max,
+                               self.meta)
+
+        # Store each variable:
+        self._set_block(time, values, names, fills=False, own=True)
+
+    def write(self, filename):
+        '''
+        Write the data in *self* to *filename* as an SWMF-formatted IMF
+        file.  The header saved in self.meta is used, if there is one.
+        Values are written with two decimal places, so reading the new file
+        gives back exactly what was read from the original (as long as the
+        data are np.float64; see *dtype* in ImfData.)
+        '''
 
-            # Extract time:
-            tNow = ' '.join(parts[:6])
-            self['time'][i] = dt.datetime.strptime(tNow, '%Y %m %d %H %M %S')
+        # We need every variable in the file:
+        missing = [v for v in imf_vars if v not in self]
+        if missing:
+            raise ValueError(f'Cannot write file without {missing}.')
 
-            # Extract remaining data:
-            for k, p in zip(keys, parts[7:]):
-                self[k][i] = p
+        with open(filename, 'w') as f:
+            write_imf_header(f, self.meta)
+            write_imf_data(f, self['time'], [self[v] for v in imf_vars])
 
     def plot_imf(self, outname=None):
         '''
@@ -525,6 +2427,10 @@ class ImfData(dict):
 
         # Start by importing.
         import matplotlib.pyplot as plt  # our base plotting package.
+        import matplotlib.dates as mdt
+
+        # Convert times to date numbers once (see plot_imf.)
+        time = mdt.date2num(self['time'])
 
         # Create a figure object, set spacing.
         fig = plt.figure(figsize=(8.5, 11))
@@ -540,25 +2446,25 @@ class ImfData(dict):
         ax1.set_title(self.file)
 
         # TOP AXES: IMF
-        ax1.plot(self['time'], self['by'], 'c--', label='$B_{Y}$')
-        ax1.plot(self['time'], self['bz'], 'b', label='$B_{Z}$')
+        DecimatedLine(ax1, time, self['by'], 'c--', label='$B_{Y}$')
+        DecimatedLine(ax1, time, self['bz'], 'b', label='$B_{Z}$')
 
         # Create a legend:
         ax1.legend(loc='upper right', ncol=2)
 
         # Horizontal lines!  Must specify the y, xStart and xEnd.  lw is width.
-        ax1.hlines(0, self['time'][0], self['time'][-1], colors='k',
+        ax1.hlines(0, time[0], time[-1], colors='k',
                    linestyles='dashed', lw=2.0)
 
         # Call our format function to cleanup and label our axes.
         format_ax(ax1, 'IMF ($nT$)')
 
         # MIDDLE AXES: NUMBER DENSITY
-        ax2.plot(self['time'], self['rho'], 'r-')
+        DecimatedLine(ax2, time, self['rho'], 'r-')
         format_ax(ax2, r'$\rho$ ($cm^{-3}$)')
 
         # BOTTOM AXES: VELOCITY
-        ax3.plot(self['time'], -1*self['vx'], 'g-')
+        DecimatedLine(ax3, time, -1*self['vx'], 'g-')
         format_ax(ax3, r'$V_{X}$ ($\frac{km}{s}$)')
 
         # Finally, either save or show the plot.
@@ -568,6 +2474,289 @@ class ImfData(dict):
             plt.show()
 
 
+def parse_dst(lines):
+    '''
+    Parse lines of Kyoto World Data Center hourly Dst files, *lines* (a
+    list of strings or bytes.)  Each line holds one day:
+
+    DST0007*01  X220 000-008-011-011-003 001 003 ...
+
+    Characters 3-4 are the year in the century, 5-6 the month, 8-9 the day,
+    14-15 the century, and 16-19 a base value (in units of 100 nT.)  Then,
+    24 hourly values follow, four characters each, starting at character
+    20.  Missing values (9999 or blank) become NaN.
+
+    Rather than splitting each line, all lines are stacked into a 2D array
+    of characters so that each field is a single slice over every line.
+    Returns arrays of times (*datetime64*) and Dst values in nT.
+    '''
+
+    # Keep only Dst lines, as bytes:
+    lines = [l.encode() if isinstance(l, str) else l for l in lines]
+    lines = [l for l in lines if l.startswith(b'DST')]
+    if not lines:
+        return (np.array([], dtype='datetime64[ms]'), np.array([]))
+
+    # Pad short (e.g., trimmed) lines out to the full 120 characters with
+    # blanks; numpy would pad them with empty bytes instead.  Stacked in a
+    # fixed-width string array and viewed as single characters, they give
+    # one row per line, one column per character.  Anything past column
+    # 120 is cut off.
+    lines = [l.rstrip(b'\r\n').ljust(120) for l in lines]
+    chars = np.array(lines, dtype='S120').view('S1').reshape(len(lines), 120)
+
+    def field(start, width):
+        # Join columns start to start+width back into strings:
+        return np.ascontiguousarray(chars[:, start:start+width]).view(
+            f'S{width}')
+
+    # Dates.  Old files leave the century blank.
+    century = field(14, 2)[:, 0]
+    century = np.where(century == b'  ', b'19', century).astype(int)
+    year = century*100 + field(3, 2)[:, 0].astype(int)
+    month = field(5, 2)[:, 0].astype(int)
+    day = field(8, 2)[:, 0].astype(int)
+
+    # Build datetime64 values with calendar arithmetic, then add hours:
+    date = ((year-1970)*12 + month-1).astype('datetime64[M]')
+    date = date.astype('datetime64[D]') + (day - 1)
+    time = (date[:, None] + np.arange(24) * np.timedelta64(1, 'h'))
+    time = time.astype('datetime64[ms]').ravel()
+
+    # Hourly values plus the base value of each day:
+    hourly = np.ascontiguousarray(chars[:, 20:116]).view('S4')
+    hourly = np.where(hourly == b'    ', b'9999', hourly).astype(float)
+    base = field(16, 4)[:, 0]
+    base = np.where(base == b'    ', b'0', base).astype(float)
+
+    dst = hourly + 100*base[:, None]
+    dst[hourly == 9999] = np.nan
+
+    return time, dst.ravel()
+
+
+class DstData(dict):
+    '''
+    Hourly Dst index from one or more Kyoto World Data Center files.  Give
+    a single file name or a list of them, e.g., one per month:
+
+    >>> dst = DstData(['Dst_July2000.dat', 'Dst_Aug2000.dat'])
+
+    All files are joined into one series, sorted by time, and parsed in a
+    single pass (see *parse_dst*.)  The result works like a dictionary
+    with keys 'time' (*datetime64* values) and 'dst' (nT.)  Where files
+    overlap, each time is kept once, taken from the first file listed.
+    Missing values are NaN and are marked in self.mask.
+    '''
+
+    def __init__(self, filename=None):
+        super(DstData, self).__init__()
+
+        self.file = filename
+        files = [] if filename is None else \
+            [filename] if isinstance(filename, str) else list(filename)
+
+        # Gather the lines of every file, then parse them all at once:
+        lines = []
+        for name in files:
+            with open(name, 'rb') as f:
+                lines += f.readlines()
+        time, dst = parse_dst(lines)
+
+        # Sort (stable, so the first file wins) and remove repeats:
+        if (np.diff(time) < np.timedelta64(0)).any():
+            order = np.argsort(time, kind='stable')
+            time, dst = time[order], dst[order]
+        keep = np.ones(time.size, dtype=bool)
+        keep[1:] = time[1:] != time[:-1]
+
+        self['time'], self['dst'] = time[keep], dst[keep]
+        self.mask = np.isnan(self['dst'])
+
+    def align(self, target, method='linear', window=None, max_gap='2h'):
+        '''
+        Map Dst onto other times, *target*: an array of *datetime64* values
+        or an object with a 'time' entry, e.g., an ImfData object.  See
+        *align_series* for the methods and other kwargs.  By default, Dst
+        is interpolated, but not across gaps of more than two hours.
+
+        Returns a dictionary with the target 'time' and 'dst'.
+        '''
+
+        if hasattr(target, 'keys'):
+            target = target['time']
+
+        return {'time': np.asarray(target),
+                'dst': align_series(self['time'], self['dst'], target,
+                                    method, window, max_gap)}
+
+    def __str__(self):
+        return f'DstData object of {self.file}'
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class ImfRenderer(object):
+    '''
+    Draw quick-look IMF plots, like *plot_imf*, for many data sets without
+    building a new figure each time.  One figure and its axes and lines
+    are built once; each call to *render* swaps in new line data.  The
+    non-interactive Agg backend is used directly, so no GUI is started and
+    no figures pile up in pyplot.
+
+    Kwargs *figsize*, *dpi*, and *style* (a Matplotlib style sheet) set the
+    look of the figure.
+    '''
+
+    def __init__(self, figsize=(8.5, 11), dpi=100,
+                 style='seaborn-v0_8-dark'):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        import matplotlib.style
+
+        self.style = style
+
+        # Styles only apply to things created while they are in use:
+        with matplotlib.style.context(style):
+            self.fig = Figure(figsize=figsize, dpi=dpi)
+            FigureCanvasAgg(self.fig)
+            self.fig.subplots_adjust(hspace=0.001, right=0.96, top=0.93,
+                                     left=0.13, bottom=0.07)
+
+            # Build the same layout as plot_imf, with empty lines:
+            ax1 = self.fig.add_subplot(211)
+            ax2 = self.fig.add_subplot(413)
+            ax3 = self.fig.add_subplot(414)
+            self.axes = [ax1, ax2, ax3]
+            for ax in self.axes:
+                ax.xaxis_date()
+
+            self.lines = {'by': ax1.plot([], [], 'c--', label='$B_{Y}$')[0],
+                          'bz': ax1.plot([], [], 'b', label='$B_{Z}$')[0],
+                          'rho': ax2.plot([], [], 'r-')[0],
+                          'vx': ax3.plot([], [], 'g-')[0]}
+            ax1.legend(loc='upper right', ncol=2)
+            ax1.axhline(0, color='k', linestyle='dashed', lw=2.0)
+
+        self.labels = ['IMF ($nT$)', r'$\rho$ ($cm^{-3}$)',
+                       r'$V_{X}$ ($\frac{km}{s}$)']
+
+    def render(self, imf, outname=None, pdf=None):
+        '''
+        Plot ImfData object (or IMF file name) *imf*.  The figure is saved
+        to file *outname* and/or added as a new page to *pdf*, an open
+        matplotlib.backends.backend_pdf.PdfPages object.
+        Returns the figure.
+        '''
+        import matplotlib.dates as mdt
+        import matplotlib.style
+
+        if not isinstance(imf, ImfData):
+            imf = ImfData(imf, variables=['by', 'bz', 'vx', 'rho'])
+
+        # Convert times once; only draw as many points as we have pixels:
+        time = mdt.date2num(imf['time'])
+        npix = int(self.fig.get_figwidth() * self.fig.dpi)
+        for name, line in self.lines.items():
+            y = -1*imf[name] if name == 'vx' else imf[name]
+            keep = decimate_minmax(time, y, npix)
+            line.set_data(time[keep], y[keep])
+
+        # Fit the axes to the new data and update ticks and labels:
+        with matplotlib.style.context(self.style):
+            self.axes[0].set_title(imf.file)
+            for ax, label in zip(self.axes, self.labels):
+                ax.relim()
+                ax.autoscale_view()
+                # Tick labels are reused between plots; format_ax hides
+                # the outer ones, so show them all again first.
+                for tick in ax.yaxis.get_major_ticks():
+                    tick.label1.set_visible(True)
+                format_ax(ax, label)
+
+            if outname:
+                self.fig.savefig(outname)
+            if pdf is not None:
+                pdf.savefig(self.fig)
+
+        return self.fig
+
+
+# Each worker process used by render_imf_files keeps its own renderer here.
+_renderer = None
+
+
+def _init_renderer(kwargs):
+    '''Create the renderer used by a worker process.'''
+    global _renderer
+    _renderer = ImfRenderer(**kwargs)
+
+
+def _render_job(job):
+    '''Render one plot in a worker process; *job* is (imf, outname).'''
+    imf, outname = job
+    _renderer.render(imf, outname)
+    return outname
+
+
+def render_imf_files(items, outdir='.', pdf=None, workers=1, **kwargs):
+    '''
+    Make quick-look plots (see *ImfRenderer*) of a list of ImfData objects
+    and/or IMF file names, *items*.
+
+    By default, each plot is saved as a PNG file in directory *outdir*,
+    named after its IMF file (e.g., "imf_jul2000.png".)  Use kwarg
+    *workers* to share the work between a pool of processes (**None** uses
+    one per CPU.)  If *pdf* is given, all plots are saved instead as pages
+    of a single PDF file of that name.  Other kwargs are handed to
+    ImfRenderer.
+
+    Returns the list of files written.
+    '''
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    items = list(items)
+
+    if pdf is not None:
+        # A PDF is a single file, so its pages are drawn one at a time:
+        from matplotlib.backends.backend_pdf import PdfPages
+        renderer = ImfRenderer(**kwargs)
+        with PdfPages(pdf) as pages:
+            for imf in items:
+                renderer.render(imf, pdf=pages)
+        return [pdf]
+
+    # Name each PNG after its file.  Repeated names get a number added.
+    names = []
+    for i, imf in enumerate(items):
+        name = imf if isinstance(imf, str) else imf.file
+        if isinstance(name, str):
+            names.append(os.path.splitext(os.path.basename(name))[0])
+        else:
+            names.append(f'imf_{i:03d}')
+    outnames = []
+    for i, name in enumerate(names):
+        if names.count(name) > 1:
+            name = f'{name}_{i:03d}'
+        outnames.append(os.path.join(outdir, name + '.png'))
+    os.makedirs(outdir, exist_ok=True)
+
+    jobs = list(zip(items, outnames))
+    if workers == 1 or len(jobs) < 2:
+        renderer = ImfRenderer(**kwargs)
+        for imf, outname in jobs:
+            renderer.render(imf, outname)
+    else:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_renderer,
+                                 initargs=(kwargs,)) as pool:
+            list(pool.map(_render_job, jobs))
+
+    return outnames
+
+
 if __name__ == '__main__':
     # This section runs when you execute this file as a script.
     # For resuable modules, this is a good place to test the